@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import db
+from migrations import migrate
+from planning import material_requirements
+from repository import get_repository, PAGE_SIZE, PARTNER_FIELDS
+
+# Замеры путей данных и расчёта стоимости на синтетических данных по образцу data.sql.
+# База SQLite создаётся по create.sql и data.sql и дополняется сгенерированными партнерами,
+# продукцией и строками заявок; результат выводится в JSON для сравнения запусков (--compare).
+#   python bench.py --lines 1000 10000 100000 --output результат.json
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+# В среднем строк заявки на партнера (в data.sql - около четырёх)
+LINES_PER_PARTNER = 4
+# Одна позиция каталога на столько строк заявок, но не меньше, чем в data.sql
+LINES_PER_PRODUCT = 100
+# Сколько партнеров берётся для замеров по одному партнеру
+SAMPLE_PARTNERS = 50
+# Увеличивается при изменении схемы или генератора, чтобы не брать устаревшие базы из кэша
+DATASET_VERSION = 2
+
+def _provider(path):
+    return db.ConnectionProvider(dict(db.DEFAULT_SETTINGS, backend="sqlite", sqlite_path=path,
+                                      pool_size="1", instrumentation="off"))
+
+def _dataset_path(data_dir, lines, seed):
+    return os.path.join(data_dir, f"bench_v{DATASET_VERSION}_{lines}_{seed}.db")
+
+def generate_dataset(path, lines, seed=1):
+    """База SQLite с данными data.sql и примерно lines строками заявок"""
+    rng = random.Random(seed)
+    provider = _provider(path)
+    conn = provider.connection()
+    try:
+        migrate(conn, "sqlite")
+        cursor = conn.cursor()
+        cursor.execute("SELECT [Тип продукции] FROM [Типы продукции]")
+        product_types = [row[0] for row in cursor.fetchall()]
+        # Процент брака по типу продукции, чтобы расчёт шёл по полной формуле
+        cursor.executemany(
+            "INSERT OR IGNORE INTO [Типы материалов] ([Тип материала], [Процент брака материала]) VALUES (?, ?)",
+            [(product_type, round(rng.uniform(0.1, 1.5), 2)) for product_type in product_types]
+        )
+        cursor.execute("SELECT [Наименование продукции] FROM [Продукция]")
+        products = [row[0] for row in cursor.fetchall()]
+        extra_products = max(0, lines // LINES_PER_PRODUCT - len(products))
+        new_products = [
+            (9000000 + i, rng.choice(product_types), f"Продукция {i:07d} {rng.randint(100, 999)}x{rng.randint(100, 999)} мм",
+             round(rng.uniform(300, 6000), 2))
+            for i in range(extra_products)
+        ]
+        cursor.executemany(
+            "INSERT INTO [Продукция] ([Артикул], [Тип продукции], [Наименование продукции], "
+            "[Минимальная стоимость для партнера]) VALUES (?, ?, ?, ?)",
+            new_products
+        )
+        products += [product[2] for product in new_products]
+
+        cursor.execute("SELECT COUNT(*) FROM [Запросы партнеров]")
+        remaining = max(0, lines - cursor.fetchone()[0])
+        partner_number = 0
+        while remaining > 0:
+            batch_partners, batch_lines = [], []
+            while remaining > 0 and len(batch_lines) < 50000:
+                name = f"Партнер {partner_number:07d}"
+                partner_number += 1
+                batch_partners.append((
+                    name, rng.choice(["ЗАО", "ООО", "ПАО", "ОАО"]), f"Директор {partner_number}",
+                    f"partner{partner_number}@example.ru", f"{rng.randint(100, 999)} {rng.randint(100, 999)} 00 00",
+                    f"Адрес {partner_number}", f"{rng.randint(10 ** 9, 10 ** 10 - 1)}", rng.randint(1, 10)
+                ))
+                count = min(remaining, rng.randint(1, 2 * LINES_PER_PARTNER - 1), len(products))
+                for product_name in rng.sample(products, count):
+                    batch_lines.append((product_name, name, rng.randint(1, 5000)))
+                remaining -= count
+            cursor.executemany(
+                f"INSERT INTO [Партнеры] ({', '.join(f'[{field}]' for field in PARTNER_FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(PARTNER_FIELDS))})",
+                batch_partners
+            )
+            cursor.executemany(
+                "INSERT INTO [Запросы партнеров] ([Продукция], [Партнер], [Количество]) VALUES (?, ?, ?)",
+                batch_lines
+            )
+        get_repository(provider).rebuild_partner_totals(conn)
+        conn.commit()
+    finally:
+        provider.close()
+
+def dataset(data_dir, lines, seed):
+    path = _dataset_path(data_dir, lines, seed)
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        try:
+            generate_dataset(path, lines, seed)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        print(f"Создан набор данных {lines} строк за {time.perf_counter() - started:.1f} с: {path}", file=sys.stderr)
+    return path
+
+def measure(fn, repeat):
+    """Время выполнения fn в мс: min, медиана, max по repeat запускам"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return {"min_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3),
+            "max_ms": round(max(times), 3), "runs": repeat}
+
+def run_benchmarks(path, repeat, seed):
+    provider = _provider(path)
+    repository = get_repository(provider)
+    conn = provider.connection()
+    try:
+        # База могла быть создана предыдущей версией (--data-dir): доводим схему до текущей
+        migrate(conn, "sqlite")
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM [Запросы партнеров]")
+        lines = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM [Партнеры]")
+        partners_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM [Продукция]")
+        products_count = cursor.fetchone()[0]
+        cursor.execute("SELECT [Наименование партнера] FROM [Партнеры] ORDER BY [Наименование партнера]")
+        names = [row[0] for row in cursor.fetchall()]
+        sample = random.Random(seed).sample(names, min(SAMPLE_PARTNERS, len(names)))
+        catalog = repository.fetch_catalog(conn)
+        editor_partner = sample[0]
+
+        def editor_load():
+            repository.load_partner(conn, editor_partner)
+            items = repository.load_request_lines(conn, editor_partner)
+            # Как в RequestEditDialog.fill_table: точная стоимость каждой строки и их сумма
+            line_costs = [catalog.line_exact(product_name, quantity) for _, product_name, quantity, _ in items]
+            return items, sum(line_costs)
+
+        original_items, _ = editor_load()
+
+        def editor_save():
+            # Изменено количество в первой строке, удалена последняя, добавлена новая продукция; откат после замера
+            items = [(product_name, quantity) for _, product_name, quantity, _ in original_items]
+            if items:
+                items[0] = (items[0][0], items[0][1] + 1)
+                items.pop()
+            used = {product_name for product_name, _ in items}
+            items.append((next(name for name in catalog.names() if name not in used), 1))
+            partner = {"Наименование партнера": editor_partner, "Рейтинг": 5}
+            try:
+                repository.save_request(conn, False, partner, items, original_items)
+            finally:
+                conn.rollback()
+
+        results = {
+            "catalog_load": measure(lambda: repository.fetch_catalog(conn), repeat),
+            "partner_list_first_page": measure(lambda: repository.list_partners_page(conn, limit=PAGE_SIZE), repeat),
+            "partner_list_first_page_by_cost": measure(
+                lambda: repository.list_partners_page(conn, sort="cost", descending=True, limit=PAGE_SIZE), repeat),
+            "partner_list_full": measure(lambda: repository.list_partners_with_totals(conn), repeat),
+            "partner_cost_sql": measure(lambda: [repository.request_cost(conn, name) for name in sample], repeat),
+            "partner_cost_exact": measure(lambda: [repository.price_partner_book(conn, name) for name in sample], repeat),
+            "editor_load": measure(editor_load, repeat),
+            "editor_save": measure(editor_save, repeat),
+            "totals_rebuild": measure(lambda: (repository.rebuild_partner_totals(conn), conn.rollback()), repeat),
+            "material_requirements": measure(lambda: material_requirements(repository.material_groups(conn)), repeat),
+        }
+        for key in ("partner_cost_sql", "partner_cost_exact"):
+            results[key]["per_partner_ms"] = round(results[key]["median_ms"] / len(sample), 4)
+        return {
+            "dataset": {"lines": lines, "partners": partners_count, "products": products_count,
+                        "sample_partners": len(sample)},
+            "results": results,
+        }
+    finally:
+        conn.rollback()
+        provider.close()
+
+def compare(current, baseline):
+    """Отношение медиан текущего запуска к базовому по каждому замеру (меньше 1 - быстрее)"""
+    baseline_runs = {run["dataset"]["lines"]: run["results"] for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        base = baseline_runs.get(run["dataset"]["lines"])
+        if not base:
+            continue
+        for name, result in run["results"].items():
+            if name in base and base[name]["median_ms"]:
+                ratio = result["median_ms"] / base[name]["median_ms"]
+                print(f"{run['dataset']['lines']:>8} {name:<34} {base[name]['median_ms']:>10.3f} -> "
+                      f"{result['median_ms']:>10.3f} мс  x{ratio:.2f}", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры загрузки списка, расчёта стоимости, редактора и каталога")
+    parser.add_argument("--lines", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="размеры наборов данных в строках заявок")
+    parser.add_argument("--repeat", type=int, default=5, help="повторов каждого замера")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора данных")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "partners-bench"),
+                        help="каталог для сгенерированных баз (переиспользуются между запусками)")
+    parser.add_argument("-o", "--output", help="файл результата JSON (по умолчанию стандартный вывод)")
+    parser.add_argument("--compare", metavar="BASELINE", help="сравнить с результатом прошлого запуска")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        "version": DATASET_VERSION,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": "sqlite",
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "runs": [],
+    }
+    for lines in args.lines:
+        path = dataset(args.data_dir, lines, args.seed)
+        report["runs"].append(run_benchmarks(path, args.repeat, args.seed))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+from db import load_settings
+from instrumentation import record_error
+from pricing import to_kopecks, defect_units, line_exact
+
+# Сколько вариантов возвращает поиск продукции по умолчанию
+SEARCH_LIMIT = 50
+
+# Продукт каталога: цена в копейках, процент брака в сотых долях процента (см. pricing.py)
+# и заранее рассчитанная точная цена единицы с учетом брака
+Product = namedtuple("Product", ["article", "name", "price_kopecks", "product_type", "defect_units", "unit_exact"])
+
+# Каталог продукции: поиск по наименованию и артикулу за O(1)
+class ProductCatalog:
+    def __init__(self, products=(), materials_defect=None):
+        """products: строки (артикул, наименование, минимальная стоимость, тип продукции);
+        materials_defect: процент брака по типу материала"""
+        self.materials_defect = dict(materials_defect or {})
+        self.by_name = {}
+        self.by_article = {}
+        for article, name, price, product_type in products:
+            price_kopecks = to_kopecks(price)
+            # Нет процента брака для типа - считаем по базовой стоимости
+            defect = defect_units(self.materials_defect.get(product_type))
+            product = Product(article, name, price_kopecks, product_type, defect, line_exact(1, price_kopecks, defect))
+            self.by_name[name] = product
+            self.by_article[article] = product
+        self._search_index = None
+        self._index_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __contains__(self, product_name):
+        return product_name in self.by_name
+
+    def names(self):
+        return list(self.by_name)
+
+    def get(self, product_name):
+        return self.by_name.get(product_name)
+
+    def get_by_article(self, article):
+        return self.by_article.get(article)
+
+    def line_exact(self, product_name, quantity):
+        """Точная стоимость строки заявки в единицах 1/EXACT_SCALE копейки"""
+        product = self.by_name.get(product_name)
+        if product is None:
+            record_error("Ошибка расчета стоимости продукта", f"продукт '{product_name}' не найден в каталоге")
+            return 0
+        return product.unit_exact * quantity
+
+    @property
+    def search_index(self):
+        """Индекс поиска продукции; каталоги из кэша приходят с готовым индексом (repository.load_catalog),
+        для остальных он строится при первом обращении (каталог после загрузки не меняется)"""
+        with self._index_lock:
+            if self._search_index is None:
+                self._search_index = ProductSearchIndex(self.by_name.values())
+            return self._search_index
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        return self.search_index.search(text, limit)
+
+def _trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+# Поиск продукции по началу и по подстроке наименования или артикула.
+# Начало ищется двоичным поиском по отсортированным ключам, подстрока - по триграммному индексу:
+# кандидаты берутся из самого короткого списка триграмм запроса и проверяются до набора limit совпадений
+class ProductSearchIndex:
+    def __init__(self, products):
+        self.names = []
+        self.keys_by_id = []
+        keys = []
+        self.trigrams = {}
+        for product in sorted(products, key=lambda product: product.name.casefold()):
+            product_id = len(self.names)
+            self.names.append(product.name)
+            name_key = product.name.casefold()
+            article_key = str(product.article)
+            keys.append((name_key, product_id))
+            keys.append((article_key, product_id))
+            # Ключ подстроки: наименование и артикул через разделитель, не встречающийся в запросе
+            key = f"{name_key}\n{article_key}"
+            for trigram in _trigrams(key):
+                self.trigrams.setdefault(trigram, []).append(product_id)
+            self.keys_by_id.append(key)
+        keys.sort()
+        self.prefix_keys = [key for key, _ in keys]
+        self.prefix_ids = [product_id for _, product_id in keys]
+
+    def _prefix_matches(self, query, limit):
+        position = bisect.bisect_left(self.prefix_keys, query)
+        while position < len(self.prefix_keys) and limit > 0 and self.prefix_keys[position].startswith(query):
+            yield self.prefix_ids[position]
+            position += 1
+            limit -= 1
+
+    def _substring_matches(self, query):
+        trigrams = _trigrams(query)
+        if not trigrams:
+            # Для одного-двух символов индекс триграмм не помогает - только поиск по началу
+            return
+        postings = []
+        for trigram in trigrams:
+            posting = self.trigrams.get(trigram)
+            if posting is None:
+                return
+            postings.append(posting)
+        for product_id in min(postings, key=len):
+            if query in self.keys_by_id[product_id]:
+                yield product_id
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """Наименования продукции: сначала совпадения по началу, затем по подстроке"""
+        query = text.strip().casefold()
+        if not query:
+            return []
+        found = []
+        seen = set()
+        for source in (self._prefix_matches(query, limit), self._substring_matches(query)):
+            for product_id in source:
+                if product_id not in seen:
+                    seen.add(product_id)
+                    found.append(self.names[product_id])
+                    if len(found) >= limit:
+                        return found
+        return found
+
+# Общий для процесса кэш каталога: в пределах TTL не выполняет запросов,
+# после истечения сверяет дешёвую сигнатуру данных и перечитывает каталог только при изменениях.
+# Кэш хранится одним кортежем (каталог, сигнатура, время проверки) и читается без блокировок:
+# peek() вызывается из потока интерфейса и не должен ждать загрузки каталога в фоновом потоке
+class CatalogCache:
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        # Загрузки из БД идут по одной; _lock защищает только замену кортежа и счётчик сбросов
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._entry = None
+        self._generation = 0
+
+    def _fresh(self, entry):
+        return entry is not None and self.clock() - entry[2] < self.ttl
+
+    def peek(self):
+        """Каталог, если он загружен и TTL не истёк, иначе None"""
+        entry = self._entry
+        return entry[0] if self._fresh(entry) else None
+
+    def get(self, load, probe=None):
+        """load() читает каталог из БД, probe() возвращает сигнатуру справочных таблиц"""
+        entry = self._entry
+        if self._fresh(entry):
+            return entry[0]
+        with self._load_lock:
+            # Пока ждали, каталог мог загрузить другой поток
+            entry = self._entry
+            if self._fresh(entry):
+                return entry[0]
+            generation = self._generation
+            signature = probe() if probe else None
+            if entry is None or signature is None or signature != entry[1]:
+                catalog = load()
+            else:
+                catalog = entry[0]
+            with self._lock:
+                # Сброс во время загрузки: прочитанный каталог мог устареть, в кэш его не кладём
+                if generation == self._generation:
+                    self._entry = (catalog, signature, self.clock())
+            return catalog
+
+    def invalidate(self):
+        """Сбросить кэш после изменения справочных таблиц: следующий get() перечитает каталог"""
+        with self._lock:
+            self._generation += 1
+            self._entry = None
+
+# TTL - параметр catalog_ttl настроек БД (config.ini или PARTNERS_DB_CATALOG_TTL)
+catalog_cache = CatalogCache(float(load_settings()["catalog_ttl"]))
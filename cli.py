@@ -0,0 +1,155 @@
+import argparse
+import json
+import sys
+
+# Режим командной строки для пакетных заданий: работает без PySide6 и дисплея.
+# Используются только модули доступа к данным (db, repository, migrations, importer)
+from db import get_provider
+from repository import get_repository
+from migrations import migrate
+from instrumentation import metrics, operation
+from planning import material_requirements, material_totals
+import importer
+import exporter
+
+def _print_error(message):
+    print(message, file=sys.stderr)
+
+def cmd_partners(conn, args):
+    rows = get_repository().list_partners_with_totals(conn)
+    rows.sort(key=lambda row: row[0]["Наименование партнера"])
+    if args.json:
+        for partner_data, cost in rows:
+            print(json.dumps(dict(partner_data, **{"Стоимость": str(cost)}), ensure_ascii=False))
+        return 0
+    for partner_data, cost in rows:
+        print(f"{partner_data['Тип партнера']} | {partner_data['Наименование партнера']}\t"
+              f"Рейтинг: {partner_data['Рейтинг']}\t{cost:.2f} ₽")
+    return 0
+
+def cmd_export(conn, args):
+    if args.partner and not get_repository().existing_partners(conn, [args.partner]):
+        _print_error(f"Партнер '{args.partner}' не найден")
+        return 1
+    if not args.output and args.format not in (None, "csv"):
+        _print_error(f"Для формата {args.format} укажите файл: -o ФАЙЛ")
+        return 1
+    report = exporter.export_file(conn, args.output or sys.stdout, args.format, args.partner, args.search or "")
+    # Итог - в поток ошибок, чтобы не смешивать его с CSV в стандартном выводе
+    _print_error(report.summary())
+    return 0
+
+def cmd_recompute(conn, args):
+    repository = get_repository()
+    count = repository.rebuild_partner_totals(conn)
+    print(f"Пересчитаны итоги партнеров: {count}")
+    print(f"Удалено старых записей журнала изменений: {repository.prune_changes(conn)}")
+    return 0
+
+def cmd_materials(conn, args):
+    requirements = material_requirements(get_repository().material_groups(conn))
+    if args.json:
+        for requirement in requirements:
+            print(json.dumps({
+                "Тип материала": requirement.material, "Тип продукции": requirement.product_type,
+                "Строк заявок": requirement.lines, "Количество продукции": requirement.quantity,
+                "Коэффициент типа продукции": str(requirement.coefficient),
+                "Процент брака материала": str(requirement.defect_percent), "Потребность": requirement.amount,
+            }, ensure_ascii=False))
+        return 0
+    totals = material_totals(requirements)
+    for requirement in requirements:
+        print(f"{requirement.material or 'Материал не указан'} | {requirement.product_type}\t"
+              f"Продукции: {requirement.quantity}\tКоэффициент: {requirement.coefficient}\t"
+              f"Брак: {requirement.defect_percent}%\tПотребность: {requirement.amount}")
+    for material, (lines, quantity, amount) in totals.items():
+        print(f"Итого {material or 'материал не указан'}: строк заявок {lines}, продукции {quantity}, потребность {amount}")
+    return 0
+
+def cmd_archive(conn, args):
+    archived = get_repository().archive_partners(conn, args.partners)
+    for partner_name in sorted(set(args.partners) - set(archived)):
+        _print_error(f"Партнер '{partner_name}' не найден среди активных")
+    print(f"Перемещено в архив партнеров: {len(archived)}")
+    return 0
+
+def cmd_restore(conn, args):
+    restored = get_repository().restore_partners(conn, args.partners)
+    for partner_name in sorted(set(args.partners) - set(restored)):
+        _print_error(f"Партнер '{partner_name}' не найден в архиве")
+    print(f"Возвращено из архива партнеров: {len(restored)}")
+    return 0
+
+def cmd_purge_archived(conn, args):
+    print(f"Удалено архивных партнеров: {get_repository().purge_archived(conn, args.days)}")
+    return 0
+
+def cmd_import(conn, args):
+    report = importer.import_file(conn, args.path, args.format)
+    for error in report.errors:
+        print(f"Строка {error.line}: {error.message}")
+    print(report.summary())
+    if args.dry_run:
+        conn.rollback()
+    return 0 if report.error_count == 0 else 2
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Заявки партнеров: команды без графического интерфейса")
+    parser.add_argument("--metrics", metavar="FILE", help="сохранить замеры запросов и операций в JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    partners = commands.add_parser("partners", help="список партнеров со стоимостью заявок")
+    partners.add_argument("--json", action="store_true", help="по одной записи JSON на строку")
+    partners.set_defaults(handler=cmd_partners)
+
+    export = commands.add_parser("export", help="строки заявок со стоимостью в CSV, XLSX или PDF")
+    export.add_argument("partner", nargs="?", help="наименование партнера (по умолчанию все партнеры)")
+    export.add_argument("-o", "--output", help="файл .csv, .xlsx или .pdf (по умолчанию CSV в стандартный вывод)")
+    export.add_argument("--format", choices=exporter.EXPORT_FORMATS, help="формат (по расширению файла, если не указан)")
+    export.add_argument("--search", help="только партнеры, подходящие под строку поиска, как в главном окне")
+    export.set_defaults(handler=cmd_export)
+
+    recompute = commands.add_parser("recompute", help="обновить схему, пересчитать итоги партнеров и очистить старый журнал изменений")
+    recompute.set_defaults(handler=cmd_recompute)
+
+    materials = commands.add_parser("materials", help="потребность в материалах для заявок активных партнеров")
+    materials.add_argument("--json", action="store_true", help="по одной записи JSON на строку")
+    materials.set_defaults(handler=cmd_materials)
+
+    archive = commands.add_parser("archive", help="переместить партнеров в архив (мягкое удаление)")
+    archive.add_argument("partners", nargs="+", help="наименования партнеров")
+    archive.set_defaults(handler=cmd_archive)
+
+    restore = commands.add_parser("restore", help="вернуть партнеров из архива")
+    restore.add_argument("partners", nargs="+", help="наименования партнеров")
+    restore.set_defaults(handler=cmd_restore)
+
+    purge = commands.add_parser("purge-archived", help="физически удалить архивных партнеров и их заявки")
+    purge.add_argument("--days", type=int, default=0, help="только находящихся в архиве дольше указанного числа дней")
+    purge.set_defaults(handler=cmd_purge_archived)
+
+    import_parser = commands.add_parser("import", help="импорт строк заявок из CSV или JSONL")
+    import_parser.add_argument("path", help="файл .csv или .jsonl")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="формат файла (по расширению, если не указан)")
+    import_parser.add_argument("--dry-run", action="store_true", help="только проверить файл, не сохраняя изменения")
+    import_parser.set_defaults(handler=cmd_import)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    provider = get_provider()
+    try:
+        with operation(f"cli:{args.command}"), provider.transaction() as conn:
+            # Как и главное окно, команды работают только с актуальной схемой
+            migrate(conn, provider.backend)
+            return args.handler(conn, args)
+    except Exception as e:
+        _print_error(f"Ошибка: {str(e)}")
+        return 1
+    finally:
+        provider.close()
+        if args.metrics:
+            metrics.export_json(args.metrics)
+
+if __name__ == "__main__":
+    sys.exit(main())
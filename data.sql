@@ -113,11 +113,7 @@ VALUES
 ('Плитка настенная Нева 30x60 см цвет серый', 'Строитель', 6120),
 ('Плитка настенная Цветок 60x120 см цвет зелено-голубой', 'Стройдвор', 5180),
 ('Ламинат с натуральным шпоном Дуб Эксперт толщина 6 мм с фаской', 'Самоделка', 4240),
-<<<<<<< HEAD
-('Ламинат с натуральным шпоном Дуб Эксперт толщина 6 мм с фаской', 'Деревянные изделия', 3300), 
-=======
-('Ламинат с натуральным шпоном Дуб Эксперт толщина 6 мм с фаской', 'Деревянные изделия', 3300), -- Исправлено здесь
->>>>>>> 9cfd716a34ee63239e92b80fddb5997f3e8e113f
+('Ламинат с натуральным шпоном Дуб Эксперт толщина 6 мм с фаской', 'Деревянные изделия', 3300),
 ('Ламинат с натуральным шпоном Дуб Эксперт толщина 6 мм с фаской', 'Декор и отделка', 2360),
 ('Ламинат Канди Дизайн 33 класс толщина 8 мм с фаской', 'Паркет', 1420),
 ('Плитка настенная Формат 20x40 см матовая цвет мята', 'Дом и сад', 1500),
@@ -0,0 +1,243 @@
+import configparser
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from instrumentation import instrument_connection
+
+# Строка подключения по умолчанию (MS SQL Server)
+DEFAULT_CONNECTION_STRING = (
+    r"DRIVER={ODBC Driver 17 for SQL Server};"
+    r"SERVER=DESKTOP-V870T0J\SQLEXPRESS;"
+    r"DATABASE=PartnerProductsDB;"
+    r"Trusted_Connection=yes;"
+)
+
+# Файл настроек: секция [database]; путь можно переопределить переменной PARTNERS_DB_CONFIG
+CONFIG_PATH = os.environ.get(
+    "PARTNERS_DB_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.ini")
+)
+# Любую настройку можно переопределить переменной окружения PARTNERS_DB_<ИМЯ>, например PARTNERS_DB_BACKEND
+ENV_PREFIX = "PARTNERS_DB_"
+
+DEFAULT_SETTINGS = {
+    "backend": "mssql",
+    "connection_string": DEFAULT_CONNECTION_STRING,
+    "sqlite_path": "partners.db",
+    "pool_size": "4",
+    "pool_timeout": "30",
+    "connect_timeout": "10",
+    "health_check_interval": "30",
+    # Время жизни кэша каталога продукции (catalog.py), секунд
+    "catalog_ttl": "300",
+    # Замеры запросов (instrumentation.py): "on" или "off"
+    "instrumentation": "on",
+}
+
+def load_settings(path=None):
+    settings = dict(DEFAULT_SETTINGS)
+    parser = configparser.ConfigParser(interpolation=None)
+    parser.read(path or CONFIG_PATH, encoding="utf-8")
+    if parser.has_section("database"):
+        settings.update(parser["database"])
+    for key in list(settings):
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            settings[key] = value
+    return settings
+
+# Фабрики соединений по имени бэкенда
+_BACKENDS = {}
+
+def register_backend(name, connect):
+    """connect(settings) -> соединение DB-API"""
+    _BACKENDS[name] = connect
+
+def _connect_mssql(settings):
+    import pyodbc
+    return pyodbc.connect(settings["connection_string"], timeout=int(settings["connect_timeout"]))
+
+# Скрипты схемы и тестовых данных MS SQL Server, по которым создаётся локальная база SQLite
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_SCRIPTS = ("create.sql", "data.sql")
+
+def sqlite_script(path):
+    """Переводит скрипт T-SQL из репозитория в диалект SQLite"""
+    with open(path, encoding="utf-8") as f:
+        script = f.read()
+    script = re.sub(r"^\s*(CREATE DATABASE|USE)\b[^\n]*\n", "", script, flags=re.M | re.I)
+    script = re.sub(r"^\s*GO\s*$", "", script, flags=re.M | re.I)
+    return script.replace("INT IDENTITY(1,1) PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+
+def seed_sqlite(conn, schema_dir=SCHEMA_DIR):
+    for name in SCHEMA_SCRIPTS:
+        conn.executescript(sqlite_script(os.path.join(schema_dir, name)))
+    conn.commit()
+
+def _row_checksum(*values):
+    """Контрольная сумма строки для сигнатур таблиц (аналог BINARY_CHECKSUM в MS SQL Server)"""
+    return zlib.crc32(repr(values).encode("utf-8"))
+
+def _connect_sqlite(settings):
+    import sqlite3
+    path = settings["sqlite_path"]
+    # Новая база (или база в памяти) создаётся по create.sql и заполняется из data.sql
+    needs_seed = path == ":memory:" or not os.path.exists(path)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=float(settings["pool_timeout"]))
+    # Регистронезависимый поиск по кириллице: встроенные LIKE и lower() в SQLite понимают только латиницу
+    conn.create_function("casefold", 1, lambda value: value.casefold() if isinstance(value, str) else value,
+                         deterministic=True)
+    conn.create_function("checksum", -1, _row_checksum, deterministic=True)
+    if needs_seed:
+        seed_sqlite(conn)
+    return conn
+
+register_backend("mssql", _connect_mssql)
+register_backend("sqlite", _connect_sqlite)
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+# Ограниченный пул соединений с проверкой простаивающих соединений перед выдачей
+class ConnectionPool:
+    def __init__(self, connect, size=4, timeout=30.0, health_check_interval=30.0, health_query="SELECT 1"):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.health_query = health_query
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _is_alive(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Нет свободных соединений с базой данных")
+        try:
+            while True:
+                try:
+                    conn, released_at = self._idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if time.monotonic() - released_at < self.health_check_interval or self._is_alive(conn):
+                    return conn
+                # Соединение оборвалось за время простоя: закрываем и пробуем следующее
+                _close_quietly(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            _close_quietly(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(conn)
+
+# Выдаёт каждому потоку своё соединение из пула (соединения pyodbc нельзя делить между потоками).
+# Соединения хранятся по идентификатору потока, а не в threading.local: потоки QThreadPool
+# получают новое состояние интерпретатора на каждую задачу, и threading.local теряется
+class ConnectionProvider:
+    def __init__(self, settings=None, connect=None):
+        self.settings = settings or load_settings()
+        self.backend = self.settings["backend"]
+        if connect is None:
+            if self.backend not in _BACKENDS:
+                raise ValueError(f"Неизвестный бэкенд базы данных: {self.backend}")
+            backend_connect = _BACKENDS[self.backend]
+            connect = lambda: backend_connect(self.settings)
+        if self.settings.get("instrumentation", "on").lower() in ("on", "1", "true", "yes"):
+            raw_connect = connect
+            connect = lambda: instrument_connection(raw_connect())
+        self.pool = ConnectionPool(
+            connect,
+            size=int(self.settings["pool_size"]),
+            timeout=float(self.settings["pool_timeout"]),
+            health_check_interval=float(self.settings["health_check_interval"])
+        )
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def connection(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            conn = self._connections.get(thread_id)
+        if conn is None:
+            conn = self.pool.acquire()
+            with self._lock:
+                self._connections[thread_id] = conn
+        return conn
+
+    def _take(self):
+        with self._lock:
+            return self._connections.pop(threading.get_ident(), None)
+
+    def release(self):
+        """Вернуть соединение текущего потока в пул"""
+        conn = self._take()
+        if conn is not None:
+            self.pool.release(conn)
+
+    def discard(self):
+        """Закрыть соединение текущего потока: следующий вызов connection() переподключится"""
+        conn = self._take()
+        if conn is not None:
+            self.pool.release(conn, broken=True)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                # Откат не прошёл - соединение неисправно
+                self.discard()
+            raise
+
+    def close(self):
+        self.release()
+        self.pool.close_all()
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = ConnectionProvider()
+        return _provider
+
+def set_provider(provider):
+    """Подменить провайдер, например на SQLite для тестов и замеров"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,394 @@
+import csv
+import os
+import re
+import sys
+import zipfile
+from xml.sax.saxutils import escape
+
+from importer import PARTNER_COLUMN, PRODUCT_COLUMN, QUANTITY_COLUMN
+from pricing import to_kopecks, defect_units, line_exact, round_exact, exact_to_decimal, kopecks_to_decimal
+from repository import get_repository, FETCH_SIZE
+
+# Потоковая выгрузка строк заявок со стоимостью с учётом брака в CSV, XLSX или PDF.
+# Строки читаются из БД порциями (repository.export_lines) и сразу пишутся в файл,
+# поэтому память не зависит от числа строк; итоги партнеров считаются на лету.
+EXPORT_FORMATS = ("csv", "xlsx", "pdf")
+COST_COLUMN = "Стоимость"
+# Строк на листе Excel; дальше выгрузка продолжается на следующем листе
+XLSX_MAX_ROWS = 1048576
+# Строк XML, которые копятся перед записью в архив
+XLSX_WRITE_BATCH = 1000
+# Шрифт PDF должен содержать кириллицу: путь задаётся PARTNERS_PDF_FONT или ищется среди системных
+PDF_FONT_PATHS = [
+    r"C:\Windows\Fonts\arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "/Library/Fonts/Arial.ttf",
+]
+
+class ExportCancelled(Exception):
+    pass
+
+class ExportError(Exception):
+    pass
+
+class ExportReport:
+    def __init__(self):
+        self.partners = 0
+        self.lines = 0
+        self.quantity = 0
+        self.kopecks = 0
+
+    def summary(self):
+        return (f"Выгружено партнеров: {self.partners}, строк заявок: {self.lines}, "
+                f"итоговая стоимость: {kopecks_to_decimal(self.kopecks):.2f} ₽")
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return extension if extension in EXPORT_FORMATS else "csv"
+
+# Форматы выгрузки: строка заявки, итог партнера и общий итог
+class CsvExportWriter:
+    """Столбцы совместимы с импортом (importer.py), поэтому итоги в файл не пишутся"""
+    def __init__(self, output):
+        self.own_file = isinstance(output, str)
+        self.file = open(output, "w", encoding="utf-8-sig", newline="") if self.own_file else output
+        self.writer = csv.writer(self.file, delimiter=";")
+        self.writer.writerow([PARTNER_COLUMN, PRODUCT_COLUMN, QUANTITY_COLUMN, COST_COLUMN])
+
+    def partner(self, partner_name):
+        pass
+
+    def line(self, partner_name, product_name, quantity, cost):
+        self.writer.writerow([partner_name, product_name, quantity, f"{cost:.2f}"])
+
+    def partner_total(self, partner_name, lines, quantity, cost):
+        pass
+
+    def total(self, report):
+        pass
+
+    def close(self):
+        if self.own_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _xml_text(value):
+    return escape(_XML_INVALID.sub("", str(value)))
+
+# Стили ячеек XLSX: 0 - обычный, 1 - денежный, 2 - полужирный, 3 - полужирный денежный
+_XLSX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="4" fontId="1" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyFont="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+class XlsxExportWriter:
+    """Книга Excel без сторонних библиотек: лист пишется в архив по мере выгрузки строк"""
+    COLUMNS = [PARTNER_COLUMN, PRODUCT_COLUMN, QUANTITY_COLUMN, COST_COLUMN]
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self.sheets = 0
+        self.sheet = None
+        self.buffer = []
+        self._new_sheet()
+
+    def _new_sheet(self):
+        if self.sheet is not None:
+            self._end_sheet()
+        self.sheets += 1
+        self.sheet = self.zip.open(f"xl/worksheets/sheet{self.sheets}.xml", "w", force_zip64=True)
+        self.sheet.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            b'<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/></sheetView></sheetViews>'
+            b'<cols><col min="1" max="1" width="40" customWidth="1"/><col min="2" max="2" width="70" customWidth="1"/>'
+            b'<col min="3" max="4" width="16" customWidth="1"/></cols><sheetData>'
+        )
+        self.rows = 0
+        self._row(self.COLUMNS, bold=True)
+
+    def _end_sheet(self):
+        self._flush()
+        self.sheet.write(b"</sheetData></worksheet>")
+        self.sheet.close()
+
+    def _flush(self):
+        if self.buffer:
+            self.sheet.write("".join(self.buffer).encode("utf-8"))
+            self.buffer.clear()
+
+    def _row(self, values, bold=False):
+        if self.rows >= XLSX_MAX_ROWS:
+            self._new_sheet()
+        self.rows += 1
+        style = ' s="2"' if bold else ""
+        cells = []
+        for value in values:
+            if value is None or value == "":
+                cells.append("<c/>")
+            elif isinstance(value, str):
+                cells.append(f'<c t="inlineStr"{style}><is><t>{_xml_text(value)}</t></is></c>')
+            elif isinstance(value, int):
+                cells.append(f"<c{style}><v>{value}</v></c>")
+            else:
+                cells.append(f'<c s="{3 if bold else 1}"><v>{value:f}</v></c>')
+        self.buffer.append(f"<row>{''.join(cells)}</row>")
+        if len(self.buffer) >= XLSX_WRITE_BATCH:
+            self._flush()
+
+    def partner(self, partner_name):
+        pass
+
+    def line(self, partner_name, product_name, quantity, cost):
+        self._row([partner_name, product_name, quantity, cost])
+
+    def partner_total(self, partner_name, lines, quantity, cost):
+        self._row([partner_name, f"Итого по партнеру, строк: {lines}", quantity, cost], bold=True)
+
+    def total(self, report):
+        self._row([f"Итого партнеров: {report.partners}", f"Строк заявок: {report.lines}",
+                   report.quantity, kopecks_to_decimal(report.kopecks)], bold=True)
+
+    def close(self):
+        self._end_sheet()
+        sheets = range(1, self.sheets + 1)
+        self.zip.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                      f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for i in sheets)
+            + "</Types>"
+        ))
+        self.zip.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ))
+        self.zip.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="Заявки {i}" sheetId="{i}" r:id="rId{i}"/>' if self.sheets > 1
+                      else f'<sheet name="Заявки" sheetId="{i}" r:id="rId{i}"/>' for i in sheets)
+            + "</sheets></workbook>"
+        ))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{i}" '
+                      f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                      f'Target="worksheets/sheet{i}.xml"/>' for i in sheets)
+            + f'<Relationship Id="rId{self.sheets + 1}" '
+              f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+            + "</Relationships>"
+        ))
+        self.zip.writestr("xl/styles.xml", _XLSX_STYLES)
+        self.zip.close()
+
+def find_pdf_font():
+    path = os.environ.get("PARTNERS_PDF_FONT")
+    if path:
+        return path
+    for path in PDF_FONT_PATHS:
+        if os.path.exists(path):
+            return path
+    raise ExportError("Не найден шрифт TrueType с кириллицей для PDF: укажите путь к нему в PARTNERS_PDF_FONT")
+
+class PdfExportWriter:
+    """Отчёт PDF (пакет reportlab): страница формируется и закрывается по мере выгрузки строк"""
+    FONT = "PartnersExportFont"
+    FONT_SIZE = 9
+    LINE_HEIGHT = 13
+    MARGIN = 40
+
+    def __init__(self, path):
+        try:
+            from reportlab.lib.pagesizes import A4
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+            from reportlab.pdfgen import canvas
+        except ImportError:
+            raise ExportError("Для выгрузки в PDF установите пакет reportlab: pip install reportlab")
+        pdfmetrics.registerFont(TTFont(self.FONT, find_pdf_font()))
+        self.string_width = pdfmetrics.stringWidth
+        self.width, self.height = A4
+        self.canvas = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle("Заявки партнеров")
+        # Правые края столбцов количества и стоимости, ширина столбца продукции
+        self.cost_x = self.width - self.MARGIN
+        self.quantity_x = self.cost_x - 110
+        self.product_width = self.quantity_x - 80 - self.MARGIN
+        self.page = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - self.MARGIN
+        if self.page == 1:
+            self.canvas.setFont(self.FONT, 14)
+            self.canvas.drawString(self.MARGIN, self.y, "Заявки партнеров")
+            self.y -= 2 * self.LINE_HEIGHT
+        self.canvas.setFont(self.FONT, self.FONT_SIZE)
+        self.canvas.drawCentredString(self.width / 2, self.MARGIN / 2, f"Страница {self.page}")
+        self._columns(PRODUCT_COLUMN, QUANTITY_COLUMN, f"{COST_COLUMN}, ₽")
+        self.canvas.line(self.MARGIN, self.y + self.LINE_HEIGHT - 3, self.cost_x, self.y + self.LINE_HEIGHT - 3)
+        self.y -= 4
+
+    def _ensure_space(self, lines):
+        if self.y - (lines - 1) * self.LINE_HEIGHT < self.MARGIN:
+            self._new_page()
+
+    def _fit(self, text, width):
+        if self.string_width(text, self.FONT, self.FONT_SIZE) <= width:
+            return text
+        while text and self.string_width(text + "…", self.FONT, self.FONT_SIZE) > width:
+            text = text[:-1]
+        return text + "…"
+
+    def _columns(self, product, quantity, cost, indent=0):
+        self.canvas.drawString(self.MARGIN + indent, self.y, self._fit(product, self.product_width - indent))
+        self.canvas.drawRightString(self.quantity_x, self.y, str(quantity))
+        self.canvas.drawRightString(self.cost_x, self.y, str(cost))
+        self.y -= self.LINE_HEIGHT
+
+    def partner(self, partner_name):
+        # Заголовок партнера не остаётся последней строкой страницы
+        self._ensure_space(3)
+        self.y -= self.LINE_HEIGHT / 2
+        self.canvas.setFont(self.FONT, self.FONT_SIZE + 2)
+        self.canvas.drawString(self.MARGIN, self.y, partner_name)
+        self.canvas.setFont(self.FONT, self.FONT_SIZE)
+        self.y -= self.LINE_HEIGHT
+
+    def line(self, partner_name, product_name, quantity, cost):
+        self._ensure_space(1)
+        self._columns(product_name, quantity, f"{cost:.2f}", indent=10)
+
+    def partner_total(self, partner_name, lines, quantity, cost):
+        self._ensure_space(1)
+        self._columns(f"Итого по партнеру, строк: {lines}", quantity, f"{cost:.2f}")
+
+    def total(self, report):
+        self._ensure_space(2)
+        self.y -= self.LINE_HEIGHT / 2
+        self._columns(f"Итого: партнеров {report.partners}, строк заявок {report.lines}",
+                      report.quantity, f"{kopecks_to_decimal(report.kopecks):.2f}")
+
+    def close(self):
+        self.canvas.save()
+
+def open_writer(output, file_format):
+    """output - путь к файлу или открытый текстовый файл (только для CSV)"""
+    if file_format == "xlsx":
+        return XlsxExportWriter(output)
+    if file_format == "pdf":
+        return PdfExportWriter(output)
+    return CsvExportWriter(output)
+
+class RequestExporter:
+    """Выгрузка строк заявок одного партнера, партнеров по строке поиска или всех партнеров"""
+    def __init__(self, conn, repository=None):
+        self.conn = conn
+        self.repository = repository or get_repository()
+
+    def run(self, writer, partner_name=None, search="", progress=None, is_cancelled=None):
+        """progress(выгружено строк) вызывается каждые FETCH_SIZE строк; is_cancelled() прерывает
+        выгрузку исключением ExportCancelled"""
+        report = ExportReport()
+        current = None
+        lines = quantity_sum = exact_sum = 0
+        for partner, product_name, quantity, price, defect in self.repository.export_lines(self.conn, partner_name, search):
+            if partner != current:
+                if current is not None:
+                    self._partner_total(writer, report, current, lines, quantity_sum, exact_sum)
+                current = partner
+                lines = quantity_sum = exact_sum = 0
+                writer.partner(partner)
+            exact = line_exact(quantity, to_kopecks(price), defect_units(defect))
+            writer.line(partner, product_name, quantity, exact_to_decimal(exact))
+            lines += 1
+            quantity_sum += quantity
+            exact_sum += exact
+            report.lines += 1
+            if report.lines % FETCH_SIZE == 0:
+                if is_cancelled and is_cancelled():
+                    raise ExportCancelled("Выгрузка отменена")
+                if progress:
+                    progress(report.lines)
+        # Отмена после последней проверки в цикле: итоги не пишутся, файл удаляет export_file
+        if is_cancelled and is_cancelled():
+            raise ExportCancelled("Выгрузка отменена")
+        if current is not None:
+            self._partner_total(writer, report, current, lines, quantity_sum, exact_sum)
+        writer.total(report)
+        return report
+
+    def _partner_total(self, writer, report, partner_name, lines, quantity, exact):
+        # Итог партнера округляется один раз, как в [Итоги партнеров]
+        kopecks = round_exact(exact)
+        writer.partner_total(partner_name, lines, quantity, kopecks_to_decimal(kopecks))
+        report.partners += 1
+        report.quantity += quantity
+        report.kopecks += kopecks
+
+def _remove_output(output, own_file):
+    if own_file and os.path.exists(output):
+        os.remove(output)
+
+def export_file(conn, output, file_format=None, partner_name=None, search="", progress=None, is_cancelled=None):
+    """Выгрузка в файл (формат по расширению, если не указан) или в открытый текстовый файл (CSV).
+    Недописанный файл при ошибке или отмене удаляется"""
+    own_file = isinstance(output, str)
+    file_format = file_format or (detect_format(output) if own_file else "csv")
+    if file_format != "csv" and not own_file:
+        raise ExportError(f"Формат {file_format} выгружается только в файл")
+    writer = open_writer(output, file_format)
+    try:
+        report = RequestExporter(conn).run(writer, partner_name, search, progress, is_cancelled)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        except Exception:
+            pass
+        _remove_output(output, own_file)
+        raise
+    # Отменили, пока файл дописывался: готовый файл удаляется так же, как недописанный
+    if is_cancelled and is_cancelled():
+        _remove_output(output, own_file)
+        raise ExportCancelled("Выгрузка отменена")
+    return report
+
+def main(argv=None):
+    # Командная строка общая с cli.py: python exporter.py ... == python cli.py export ...
+    import cli
+    return cli.main(["export"] + list(sys.argv[1:] if argv is None else argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import csv
+import itertools
+import json
+import os
+import sys
+from collections import namedtuple
+
+from repository import get_repository, IN_BATCH
+
+# Потоковый импорт строк заявок из CSV или JSONL.
+# Файл читается порциями по IMPORT_CHUNK_SIZE строк: каждая порция проверяется по каталогу
+# и списку партнеров и записывается пакетно, поэтому память не зависит от размера файла.
+IMPORT_CHUNK_SIZE = 1000
+# Сколько ошибок хранить для отчёта; остальные только подсчитываются
+MAX_REPORTED_ERRORS = 1000
+
+# Столбцы файла: партнер, продукция (наименование или артикул) и количество
+PARTNER_COLUMN = "Партнер"
+PRODUCT_COLUMN = "Продукция"
+ARTICLE_COLUMN = "Артикул"
+QUANTITY_COLUMN = "Количество"
+
+RowError = namedtuple("RowError", ["line", "message"])
+
+class ImportCancelled(Exception):
+    pass
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.partners = set()
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+    def summary(self):
+        text = f"Обработано строк: {self.processed}, импортировано: {self.imported}, с ошибками: {self.error_count}"
+        if self.error_count > len(self.errors):
+            text += f" (показаны первые {len(self.errors)})"
+        return text
+
+def detect_format(path):
+    return "jsonl" if os.path.splitext(path)[1].lower() in (".jsonl", ".json", ".ndjson") else "csv"
+
+def _csv_rows(f):
+    sample = f.readline()
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(itertools.chain([sample], f), dialect=dialect)
+    for row in reader:
+        # Строка 1 - заголовок
+        yield reader.line_num, row
+
+def _jsonl_rows(f):
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("ожидается объект JSON")
+
+def read_rows(f, file_format):
+    """Строки файла по одной: (номер строки, словарь столбцов или исключение разбора)"""
+    return _jsonl_rows(f) if file_format == "jsonl" else _csv_rows(f)
+
+def _text(row, column):
+    value = row.get(column)
+    return str(value).strip() if value is not None else ""
+
+class RequestImporter:
+    """Проверяет строки по каталогу и партнерам и пакетно добавляет их в [Запросы партнеров].
+    Повтор продукции у партнера (в файле или в базе) увеличивает количество существующей строки"""
+    def __init__(self, conn, repository=None, chunk_size=IMPORT_CHUNK_SIZE):
+        self.conn = conn
+        self.repository = repository or get_repository()
+        self.chunk_size = chunk_size
+        self.catalog = self.repository.load_catalog(conn)
+        self.known_partners = set()
+        self.unknown_partners = set()
+        # Пары (партнер, продукция), у которых уже есть строка заявки
+        self.existing_lines = set()
+
+    def _check_partners(self, names):
+        names = [name for name in names if name not in self.known_partners and name not in self.unknown_partners]
+        if not names:
+            return
+        found = self.repository.existing_partners(self.conn, names)
+        self.known_partners.update(found)
+        self.unknown_partners.update(set(names) - found)
+        for name, product_name in self.repository.request_line_keys(self.conn, found):
+            self.existing_lines.add((name, product_name))
+
+    def _validate(self, line, row, report):
+        if isinstance(row, Exception):
+            report.add_error(line, f"Ошибка разбора строки: {row}")
+            return None
+        partner_name = _text(row, PARTNER_COLUMN)
+        product_name = _text(row, PRODUCT_COLUMN)
+        article = _text(row, ARTICLE_COLUMN)
+        if not partner_name:
+            report.add_error(line, "Не указан партнер")
+            return None
+        if partner_name in self.unknown_partners:
+            report.add_error(line, f"Партнер '{partner_name}' не найден")
+            return None
+        if product_name:
+            product = self.catalog.get(product_name)
+        elif article.isdigit():
+            product = self.catalog.get_by_article(int(article))
+        else:
+            report.add_error(line, "Не указана продукция")
+            return None
+        if product is None:
+            report.add_error(line, f"Продукция '{product_name or article}' не найдена в каталоге")
+            return None
+        try:
+            quantity = int(_text(row, QUANTITY_COLUMN))
+        except ValueError:
+            quantity = 0
+        if quantity < 1:
+            report.add_error(line, "Количество должно быть целым числом больше нуля")
+            return None
+        return partner_name, product.name, quantity
+
+    def _write_chunk(self, rows, report):
+        self._check_partners({_text(row, PARTNER_COLUMN) for _, row in rows if isinstance(row, dict)})
+        quantities = {}
+        for line, row in rows:
+            valid = self._validate(line, row, report)
+            if valid:
+                partner_name, product_name, quantity = valid
+                key = (partner_name, product_name)
+                quantities[key] = quantities.get(key, 0) + quantity
+                report.imported += 1
+        inserts, updates = [], []
+        for (partner_name, product_name), quantity in quantities.items():
+            if (partner_name, product_name) in self.existing_lines:
+                updates.append((quantity, partner_name, product_name))
+            else:
+                inserts.append((product_name, partner_name, quantity))
+                self.existing_lines.add((partner_name, product_name))
+            report.partners.add(partner_name)
+        self.repository.append_request_lines(self.conn, inserts, updates)
+        report.processed += len(rows)
+
+    def run(self, f, file_format="csv", progress=None, is_cancelled=None):
+        """Импорт из открытого файла. progress(обработано строк) вызывается после каждой порции;
+        is_cancelled() прерывает импорт исключением ImportCancelled (транзакцию откатывает вызывающий код)"""
+        def check_cancelled():
+            if is_cancelled and is_cancelled():
+                raise ImportCancelled("Импорт отменён")
+
+        report = ImportReport()
+        rows = read_rows(f, file_format)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            check_cancelled()
+            self._write_chunk(chunk, report)
+            if progress:
+                progress(report.processed)
+        # Новые версии партнеров (открытые в диалогах заявки не перезапишут импортированные строки),
+        # их итоги и журнал - пакетно; отмена во время пересчёта тоже откатывает весь импорт
+        partners = sorted(report.partners)
+        for i in range(0, len(partners), IN_BATCH):
+            check_cancelled()
+            self.repository.touch_partners(self.conn, partners[i:i + IN_BATCH])
+        check_cancelled()
+        return report
+
+def import_file(conn, path, file_format=None, progress=None, is_cancelled=None):
+    """Импорт файла CSV (UTF-8, разделитель , ; или табуляция) или JSONL в текущей транзакции"""
+    file_format = file_format or detect_format(path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return RequestImporter(conn).run(f, file_format, progress, is_cancelled)
+
+def main(argv=None):
+    # Командная строка общая с cli.py: python importer.py ФАЙЛ == python cli.py import ФАЙЛ
+    import cli
+    return cli.main(["import"] + list(sys.argv[1:] if argv is None else argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Замеры горячих путей: каждый запрос к БД (текст, число строк, время) и операции интерфейса.
+# Соединения оборачиваются в db.ConnectionProvider, операции отмечаются через operation()/start_span().
+# Данные смотрятся в окне диагностики (main.py) и выгружаются в JSON (export_json, cli.py --metrics)
+
+# Границы корзин гистограммы задержек, мс (последняя корзина - всё, что больше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Один и тот же запрос столько раз за одну операцию - признак N+1
+N_PLUS_ONE_THRESHOLD = 10
+# Сколько последних ошибок и предупреждений N+1 хранить
+MAX_EVENTS = 200
+
+def normalize_sql(sql):
+    return re.sub(r"\s+", " ", sql).strip()
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        index = 0
+        while index < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает доля fraction замеров"""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(float(LATENCY_BUCKETS_MS[index]), self.max_ms) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "buckets_ms": dict(zip([f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["more"], self.counts)),
+        }
+
+class Metrics:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.queries = {}
+            self.operations = {}
+            self.n_plus_one = []
+            self.errors = []
+            # Запросы текущей операции по потокам: {id потока: (операция, {запрос: число выполнений})}
+            self._current = {}
+
+    def _event(self, events, event):
+        events.append(event)
+        del events[:-MAX_EVENTS]
+
+    def record_query(self, sql, ms, rows=0):
+        sql = normalize_sql(sql)
+        with self._lock:
+            stats = self.queries.get(sql)
+            if stats is None:
+                stats = self.queries[sql] = {"histogram": Histogram(), "rows": 0}
+            stats["histogram"].add(ms)
+            stats["rows"] += max(rows, 0)
+            current = self._current.get(threading.get_ident())
+            if current is not None:
+                executed = current[1]
+                executed[sql] = executed.get(sql, 0) + 1
+
+    def record_rows(self, sql, rows):
+        with self._lock:
+            stats = self.queries.get(normalize_sql(sql))
+            if stats is not None:
+                stats["rows"] += rows
+
+    def record_operation(self, name, ms):
+        with self._lock:
+            self.operations.setdefault(name, Histogram()).add(ms)
+
+    def record_error(self, context, error):
+        with self._lock:
+            self._event(self.errors, {"time": time.time(), "context": context, "error": str(error)})
+
+    def begin_operation(self, name):
+        with self._lock:
+            self._current[threading.get_ident()] = (name, {})
+
+    def end_operation(self, name, ms):
+        with self._lock:
+            current = self._current.pop(threading.get_ident(), None)
+            self.operations.setdefault(name, Histogram()).add(ms)
+            if current is None:
+                return
+            for sql, count in current[1].items():
+                if count >= N_PLUS_ONE_THRESHOLD:
+                    self._event(self.n_plus_one, {"time": time.time(), "operation": name, "query": sql, "count": count})
+
+    def snapshot(self):
+        with self._lock:
+            queries = [
+                dict(stats["histogram"].to_dict(), query=sql, rows=stats["rows"])
+                for sql, stats in self.queries.items()
+            ]
+            operations = [dict(histogram.to_dict(), operation=name) for name, histogram in self.operations.items()]
+            return {
+                "started": self.started,
+                "captured": time.time(),
+                "queries": sorted(queries, key=lambda query: query["total_ms"], reverse=True),
+                "operations": sorted(operations, key=lambda operation: operation["operation"]),
+                "n_plus_one": list(self.n_plus_one),
+                "errors": list(self.errors),
+            }
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+metrics = Metrics()
+
+@contextmanager
+def operation(name):
+    """Замер операции; запросы, выполненные в ней этим потоком, проверяются на N+1"""
+    started = metrics.clock()
+    metrics.begin_operation(name)
+    try:
+        yield
+    finally:
+        metrics.end_operation(name, (metrics.clock() - started) * 1000)
+
+class Span:
+    """Замер операции интерфейса, которая завершается в другом обработчике (например, по сигналу)"""
+    def __init__(self, name):
+        self.name = name
+        self.started = metrics.clock()
+        self.finished = False
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            metrics.record_operation(self.name, (metrics.clock() - self.started) * 1000)
+
+def start_span(name):
+    return Span(name)
+
+def record_error(context, error):
+    """Ошибка, после которой работа продолжается (fallback): выводится в stderr и попадает в диагностику.
+    В stdout не пишем: туда выводят данные cli.py (без --output) и bench.py"""
+    print(f"{context}: {str(error)}", file=sys.stderr)
+    metrics.record_error(context, error)
+
+# Обёртки DB-API: время выполнения запроса и число строк (rowcount изменений или число прочитанных строк)
+class InstrumentedCursor:
+    def __init__(self, cursor, connection):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "connection", connection)
+        object.__setattr__(self, "_sql", None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # Например, fast_executemany у курсора pyodbc
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _run(self, method, sql, params):
+        started = metrics.clock()
+        try:
+            if params is None:
+                method(sql)
+            else:
+                method(sql, params)
+        finally:
+            rowcount = getattr(self._cursor, "rowcount", -1)
+            metrics.record_query(sql, (metrics.clock() - started) * 1000, rowcount if rowcount and rowcount > 0 else 0)
+            object.__setattr__(self, "_sql", sql)
+        return self
+
+    def execute(self, sql, params=None):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._run(self._cursor.executemany, sql, params)
+
+    def _fetched(self, rows):
+        if self._sql is not None and rows:
+            metrics.record_rows(self._sql, rows)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        return InstrumentedCursor(self._conn.cursor(), self)
+
+def instrument_connection(conn):
+    return conn if isinstance(conn, InstrumentedConnection) else InstrumentedConnection(conn)
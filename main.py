@@ -1,15 +1,52 @@
+import os
 import sys
-import decimal
 import re
+import threading
+import time
+
+# Отсчёт времени запуска начинается до загрузки PySide6
+STARTUP_STARTED = time.perf_counter()
+
 from PySide6.QtWidgets import (
-    QApplication, QWidget, QMainWindow, QListWidget, QListWidgetItem,
+    QApplication, QWidget, QMainWindow, QListView, QStyledItemDelegate, QStyle,
     QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QMessageBox, QLineEdit,
     QComboBox, QDialog, QSpinBox, QGroupBox, QGridLayout, QFrame, 
-    QTableWidget, QHeaderView, QAbstractItemView, QSizePolicy, QTableWidgetItem
+    QTableWidget, QHeaderView, QAbstractItemView, QSizePolicy, QTableWidgetItem,
+    QProgressBar, QCompleter, QProgressDialog
 )
-from PySide6.QtGui import QIcon, QFont, QPixmap, QRegularExpressionValidator
-from PySide6.QtCore import Qt, QRegularExpression
-import pyodbc
+from PySide6.QtGui import QIcon, QFont, QFontMetrics, QRegularExpressionValidator, QColor, QPen
+from PySide6.QtCore import (
+    Qt, QRegularExpression, QObject, QRunnable, QThreadPool, Signal,
+    QAbstractListModel, QModelIndex, QRect, QSize, QStringListModel, QTimer
+)
+from catalog import ProductCatalog, catalog_cache
+from db import get_provider
+from migrations import migrate
+from repository import get_repository, PartnerExistsError, SaveConflictError, PAGE_SIZE, page_key, merge_request_items
+from pricing import exact_to_decimal
+from planning import material_requirements, material_totals
+from instrumentation import metrics, operation, start_span, record_error
+
+# Бюджет холодного запуска: окно показано / первая страница списка загружена, мс.
+# Превышение бюджета записывается в диагностику (instrumentation.record_error, stderr);
+# при PARTNERS_STARTUP_TIMING=1 замеры всех этапов выводятся в stderr
+STARTUP_BUDGET_MS = {"window": 500, "first_page": 1500}
+ICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
+
+_startup_marks = {}
+
+def startup_mark(name):
+    """Фиксирует этап запуска один раз и сверяет его с бюджетом"""
+    if name in _startup_marks:
+        return
+    elapsed = (time.perf_counter() - STARTUP_STARTED) * 1000
+    _startup_marks[name] = elapsed
+    metrics.record_operation(f"startup:{name}", elapsed)
+    budget = STARTUP_BUDGET_MS.get(name)
+    if budget is not None and elapsed > budget:
+        record_error("Запуск", f"этап '{name}' занял {elapsed:.0f} мс при бюджете {budget} мс")
+    elif os.environ.get("PARTNERS_STARTUP_TIMING"):
+        print(f"Запуск: этап '{name}' - {elapsed:.0f} мс", file=sys.stderr)
 
 # Константы стиля
 FONT_FAMILY = "Bahnschrift Light SemiCondensed"
@@ -17,108 +54,362 @@ COLOR_BG_MAIN = "#BBDCFA"
 COLOR_BG_ALT = "#FFFFFF"
 COLOR_ACCENT = "#0C4882"
 
-# Подключение к базе данных MS SQL Server
-def create_connection():
-    try:
-        conn = pyodbc.connect(
-            r"DRIVER={ODBC Driver 17 for SQL Server};"
-            r"SERVER=DESKTOP-V870T0J\SQLEXPRESS;"
-            r"DATABASE=PartnerProductsDB;"
-            r"Trusted_Connection=yes;"
-        )
-        return conn
-    except Exception as e:
-        QMessageBox.critical(None, "Ошибка подключения к БД",
-                             f"Не удалось подключиться к базе данных.\n\n{str(e)}")
-        sys.exit(1)
-
-# Функция для подсчёта стоимости заявки с учетом брака материала
-def calculate_request_cost(cursor, partner_name):
-    try:
-        query = """
-        SELECT 
-            SUM(rp.[Количество] * p.[Минимальная стоимость для партнера] * 
-                (1 + COALESCE(m.[Процент брака материала], 0) / 100.0)
-        FROM [Запросы партнеров] rp
-        JOIN [Продукция] p ON rp.[Продукция] = p.[Наименование продукции]
-        JOIN [Типы продукции] tp ON p.[Тип продукции] = tp.[Тип продукции]
-        JOIN [Типы материалов] m ON tp.[Тип продукции] = m.[Тип материала]
-        WHERE rp.[Партнер] = ?
-        """
-        cursor.execute(query, partner_name)
-        result = cursor.fetchone()
-        total = result[0] if result[0] is not None else 0
-        total = max(decimal.Decimal(total).quantize(decimal.Decimal('0.01')), decimal.Decimal('0.00'))
-        return total
-    except Exception as e:
-        # Fallback на случай ошибки
-        print(f"Ошибка расчета стоимости с учетом брака: {str(e)}")
-        try:
-            query_fallback = """
-            SELECT SUM(rp.[Количество] * p.[Минимальная стоимость для партнера])
-            FROM [Запросы партнеров] rp
-            JOIN [Продукция] p ON rp.[Продукция] = p.[Наименование продукции]
-            WHERE rp.[Партнер] = ?
-            """
-            cursor.execute(query_fallback, partner_name)
-            result = cursor.fetchone()
-            total = result[0] if result[0] is not None else 0
-            total = max(decimal.Decimal(total).quantize(decimal.Decimal('0.01')), decimal.Decimal('0.00'))
-            return total
-        except Exception as e2:
-            print(f"Ошибка fallback расчета: {str(e2)}")
-            return decimal.Decimal('0.00')
-
-# Виджет для отображения одной заявки
-class RequestItemWidget(QWidget):
-    def __init__(self, partner_data, cost):
+# Фоновые задачи БД: каждый поток пула берёт своё соединение у провайдера (см. db.py)
+# Сколько загруженных строк модель отдаёт представлению за один fetchMore
+FETCH_BATCH = 50
+# Запас загруженных, но ещё не показанных строк: меньше - запрашивается следующая страница
+PREFETCH_ROWS = PAGE_SIZE
+# Задержка перед поиском после ввода в строку поиска, мс
+SEARCH_DELAY_MS = 300
+# Период опроса журнала изменений других клиентов, мс
+SYNC_INTERVAL_MS = 5000
+_db_pool = None
+
+def db_thread_pool():
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = QThreadPool()
+        # Потоков не больше, чем соединений в пуле провайдера
+        _db_pool.setMaxThreadCount(get_provider().pool.size)
+    return _db_pool
+
+class WorkerSignals(QObject):
+    chunk = Signal(object)
+    finished = Signal(object)
+    failed = Signal(object)
+
+class TaskCancelled(Exception):
+    pass
+
+class DbWorker(QRunnable):
+    """Выполняет fn(conn, worker, *args) в потоке пула; результат приходит через сигналы"""
+    def __init__(self, fn, *args):
         super().__init__()
-        self.partner_data = partner_data
-        self.cost = cost
-        self.init_ui()
+        self.fn = fn
+        self.args = args
+        self.signals = WorkerSignals()
+        self._cancelled = threading.Event()
 
-    def init_ui(self):
-        h_layout = QHBoxLayout()
-        h_layout.setContentsMargins(10, 10, 10, 10)
+    def cancel(self):
+        self._cancelled.set()
 
-        v_left = QVBoxLayout()
-        top_label = QLabel(f"<b>{self.partner_data['Тип партнера']}</b> | <b>{self.partner_data['Наименование партнера']}</b>")
-        top_label.setFont(QFont(FONT_FAMILY, 11))
-        v_left.addWidget(top_label)
+    def is_cancelled(self):
+        return self._cancelled.is_set()
 
-        addr_label = QLabel(self.partner_data['Юридический адрес партнера'])
-        addr_label.setFont(QFont(FONT_FAMILY, 9))
-        v_left.addWidget(addr_label)
+    def emit_chunk(self, data):
+        if not self.is_cancelled():
+            self.signals.chunk.emit(data)
 
-        phone_label = QLabel(self.partner_data['Телефон партнера'])
-        phone_label.setFont(QFont(FONT_FAMILY, 9))
-        v_left.addWidget(phone_label)
+    def run(self):
+        if self.is_cancelled():
+            return
+        provider = get_provider()
+        try:
+            # При ошибке транзакция откатывается, неисправное соединение закрывается провайдером.
+            # Время задачи и её запросы попадают в диагностику (instrumentation.py)
+            with operation(f"db:{self.fn.__name__}"), provider.transaction() as conn:
+                result = self.fn(conn, self, *self.args)
+                if self.is_cancelled():
+                    # Отменённая задача не фиксирует изменений: транзакция откатывается
+                    raise TaskCancelled()
+        except Exception as e:
+            if not self.is_cancelled():
+                self.signals.failed.emit(e)
+            return
+        finally:
+            # Соединение возвращается в пул после каждой задачи: перед следующей выдачей
+            # пул проверит простоявшее соединение и при обрыве подключится заново
+            provider.release()
+        if not self.is_cancelled():
+            self.signals.finished.emit(result)
 
-        rating_label = QLabel(f"Рейтинг: {self.partner_data['Рейтинг']}")
-        rating_label.setFont(QFont(FONT_FAMILY, 9))
-        v_left.addWidget(rating_label)
+class TaskRunner:
+    """Запускает задачи по ключу; новая задача с тем же ключом отменяет предыдущую"""
+    def __init__(self):
+        self.active = {}
+
+    def start(self, key, fn, *args, on_done=None, on_chunk=None, on_error=None):
+        self.cancel(key)
+        worker = DbWorker(fn, *args)
+
+        def deliver(callback, final=True):
+            def slot(value):
+                if worker.is_cancelled():
+                    return
+                if final and self.active.get(key) is worker:
+                    del self.active[key]
+                if callback:
+                    callback(value)
+            return slot
 
-        h_layout.addLayout(v_left)
+        worker.signals.chunk.connect(deliver(on_chunk, final=False))
+        worker.signals.finished.connect(deliver(on_done))
+        worker.signals.failed.connect(deliver(on_error))
+        self.active[key] = worker
+        db_thread_pool().start(worker)
+        return worker
 
-        cost_label = QLabel(f"<b>Стоимость: {self.cost} ₽</b>")
-        cost_label.setFont(QFont(FONT_FAMILY, 11))
-        cost_label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        cost_label.setFixedWidth(150)
-        h_layout.addWidget(cost_label)
+    def is_running(self, key):
+        return key in self.active
+
+    def cancel(self, key):
+        worker = self.active.pop(key, None)
+        if worker:
+            worker.cancel()
+
+    def cancel_all(self):
+        for key in list(self.active):
+            self.cancel(key)
+
+# Задачи БД, выполняемые в потоках пула (сигнатура: conn, worker, *args)
+# Модули, нужные не при каждом запуске (импорт, экспорт), загружаются при первом использовании
+def migrate_task(conn, worker):
+    return migrate(conn, get_provider().backend)
+
+def load_partners_page_task(conn, worker, search, sort, descending, after):
+    """(версия журнала изменений или None, строки страницы); версия читается перед первой страницей,
+    поэтому изменения, сделанные во время загрузки, придут при следующем опросе"""
+    repository = get_repository()
+    version = None
+    if after is None:
+        try:
+            version = repository.change_version(conn)
+        except Exception as e:
+            record_error("Журнал изменений недоступен", e)
+    return version, repository.list_partners_page(conn, search, sort, descending, after, PAGE_SIZE)
 
-        self.setLayout(h_layout)
-        self.setStyleSheet(f"background-color: {COLOR_BG_ALT}; border: 1px solid #999999;")
+def sync_changes_task(conn, worker, version, search):
+    """(новая версия, {партнер: строка или None}); вместо словаря None - перечитать список целиком"""
+    repository = get_repository()
+    version, partner_names = repository.changes_since(conn, version)
+    if partner_names is None:
+        return version, None
+    return version, repository.load_partner_rows(conn, partner_names, search) if partner_names else {}
+
+def load_partner_row_task(conn, worker, partner_name, search):
+    """(партнер, строка списка или None - нет заявок или не подходит под строку поиска)"""
+    return partner_name, get_repository().load_partner_rows(conn, [partner_name], search)[partner_name]
+
+def load_catalog_task(conn, worker):
+    # Каталог приходит с готовым индексом поиска (repository.load_catalog)
+    return get_repository().load_catalog(conn)
+
+def load_partner_task(conn, worker, partner_name):
+    return get_repository().load_partner(conn, partner_name)
+
+def load_request_items_task(conn, worker, partner_name):
+    return get_repository().load_request_lines(conn, partner_name)
+
+def save_request_task(conn, worker, is_new, partner, items, original_items=(), partner_version=None):
+    return get_repository().save_request(conn, is_new, partner, items, original_items, partner_version)
+
+def archive_partners_task(conn, worker, partner_names):
+    return get_repository().archive_partners(conn, partner_names)
+
+def export_requests_task(conn, worker, path, file_format, partner_name, search):
+    from exporter import export_file
+    return export_file(conn, path, file_format, partner_name, search,
+                       progress=worker.emit_chunk, is_cancelled=worker.is_cancelled)
+
+def material_requirements_task(conn, worker):
+    return material_requirements(get_repository().material_groups(conn))
+
+def import_requests_task(conn, worker, path):
+    from importer import import_file
+    # Отмена прерывает импорт исключением, и вся транзакция откатывается
+    return import_file(conn, path, progress=worker.emit_chunk, is_cancelled=worker.is_cancelled)
+
+# Модель списка партнеров: строки (данные партнера, стоимость) приходят с сервера страницами
+# и отдаются представлению порциями; следующая страница запрашивается через request_more заранее
+PartnerRole = Qt.UserRole
+CostRole = Qt.UserRole + 1
+
+class PartnerListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._positions = {}
+        self._visible = 0
+        self.has_more = False
+        self.request_more = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._visible
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._visible:
+            return None
+        partner_data, cost = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return partner_data["Наименование партнера"]
+        if role == PartnerRole:
+            return partner_data
+        if role == CostRole:
+            return cost
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and (self._visible < len(self._rows) or self.has_more)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH, len(self._rows) - self._visible)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self._visible, self._visible + count - 1)
+            self._visible += count
+            self.endInsertRows()
+        if self.has_more and len(self._rows) - self._visible < PREFETCH_ROWS and self.request_more:
+            self.request_more()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self._positions = {}
+        self._visible = 0
+        self.has_more = False
+        self.endResetModel()
+
+    def append_rows(self, rows, has_more=False):
+        self.has_more = has_more
+        for row in rows:
+            partner_name = row[0]["Наименование партнера"]
+            # Строка могла уже появиться через точечное обновление во время загрузки
+            if partner_name in self._positions:
+                continue
+            self._positions[partner_name] = len(self._rows)
+            self._rows.append(row)
+        # Первую порцию показываем сразу, остальное представление запросит при прокрутке
+        if self._visible < FETCH_BATCH:
+            self.fetchMore()
+
+    # Точечное изменение одной строки без сброса модели: выделение и прокрутка сохраняются
+    def update_partner(self, partner_name, row):
+        position = self._positions.get(partner_name)
+        if row is None:
+            if position is not None:
+                self.remove_partner(partner_name)
+        elif position is None:
+            # Новый партнер появляется в конце уже показанной части списка
+            position = self._visible
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._rows.insert(position, row)
+            self._visible += 1
+            self._reindex(position)
+            self.endInsertRows()
+        else:
+            self._rows[position] = row
+            if position < self._visible:
+                index = self.index(position)
+                self.dataChanged.emit(index, index)
+
+    def remove_partner(self, partner_name):
+        self.remove_partners([partner_name])
+
+    def remove_partners(self, partner_names):
+        """Подряд идущие строки удаляются одним диапазоном, позиции пересчитываются один раз"""
+        positions = sorted({self._positions[name] for name in partner_names if name in self._positions}, reverse=True)
+        i = 0
+        while i < len(positions):
+            last = first = positions[i]
+            while i + 1 < len(positions) and positions[i + 1] == first - 1:
+                i += 1
+                first -= 1
+            i += 1
+            visible = first < self._visible
+            if visible:
+                visible_last = min(last, self._visible - 1)
+                self.beginRemoveRows(QModelIndex(), first, visible_last)
+            for partner_data, _ in self._rows[first:last + 1]:
+                del self._positions[partner_data["Наименование партнера"]]
+            del self._rows[first:last + 1]
+            if visible:
+                self._visible -= visible_last - first + 1
+                self.endRemoveRows()
+        if positions:
+            self._reindex(positions[-1])
+
+    def _reindex(self, start):
+        for i in range(start, len(self._rows)):
+            self._positions[self._rows[i][0]["Наименование партнера"]] = i
+
+# Делегат, рисующий карточку заявки: тип | наименование, адрес, телефон, рейтинг и стоимость
+class RequestItemDelegate(QStyledItemDelegate):
+    MARGIN = 10
+    SPACING = 4
+    COST_WIDTH = 150
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont(FONT_FAMILY, 11)
+        self.title_font.setBold(True)
+        self.text_font = QFont(FONT_FAMILY, 9)
+        title_height = QFontMetrics(self.title_font).height()
+        text_height = QFontMetrics(self.text_font).height()
+        self.title_height = title_height
+        self.text_height = text_height
+        self.card_height = 2 * self.MARGIN + title_height + 3 * (text_height + self.SPACING) + 2
+
+    def sizeHint(self, option, index):
+        # Ширина карточки берётся по ширине представления
+        return QSize(0, self.card_height)
+
+    def paint(self, painter, option, index):
+        partner_data = index.data(PartnerRole)
+        cost = index.data(CostRole)
+        if partner_data is None:
+            return
+        painter.save()
+        card = option.rect.adjusted(1, 1, -1, -1)
+        selected = bool(option.state & QStyle.State_Selected)
+        painter.fillRect(card, QColor(COLOR_BG_ALT))
+        painter.setPen(QPen(QColor(COLOR_ACCENT if selected else "#999999"), 2 if selected else 1))
+        painter.drawRect(card)
+
+        content = card.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        cost_text = f"Стоимость: {cost} ₽"
+        cost_width = max(self.COST_WIDTH, QFontMetrics(self.title_font).horizontalAdvance(cost_text))
+        text_rect = QRect(content.left(), content.top(), content.width() - cost_width - self.MARGIN, self.title_height)
+        painter.setPen(QColor("black"))
+        painter.setFont(self.title_font)
+        title = f"{partner_data['Тип партнера']} | {partner_data['Наименование партнера']}"
+        painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         painter.fontMetrics().elidedText(title, Qt.ElideRight, text_rect.width()))
+
+        painter.setFont(self.text_font)
+        lines = [
+            partner_data['Юридический адрес партнера'],
+            partner_data['Телефон партнера'],
+            f"Рейтинг: {partner_data['Рейтинг']}"
+        ]
+        y = text_rect.bottom() + self.SPACING
+        for line in lines:
+            line_rect = QRect(content.left(), y, text_rect.width(), self.text_height)
+            painter.drawText(line_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                             painter.fontMetrics().elidedText(str(line), Qt.ElideRight, line_rect.width()))
+            y += self.text_height + self.SPACING
+
+        painter.setFont(self.title_font)
+        cost_rect = QRect(content.right() - cost_width, content.top(), cost_width, content.height())
+        painter.drawText(cost_rect, Qt.AlignRight | Qt.AlignVCenter, cost_text)
+        painter.restore()
 
 # Главное окно приложения
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.conn = create_connection()
+        self.tasks = TaskRunner()
         self.setWindowTitle("Заявки партнеров - Новые технологии")
-        self.setWindowIcon(QIcon("icon.ico"))
         self.setMinimumSize(700, 500)
         self.init_ui()
-        self.load_requests()
+        # Метка синхронизации: версия журнала изменений, до которой список актуален
+        self.sync_version = None
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setInterval(SYNC_INTERVAL_MS)
+        self.sync_timer.timeout.connect(self.poll_changes)
+        self.sync_timer.start()
+        # Подключение к БД и загрузка начинаются после первой отрисовки окна
+        QTimer.singleShot(0, self.migrate_schema)
 
     def init_ui(self):
         central_widget = QWidget()
@@ -127,13 +418,20 @@ class MainWindow(QMainWindow):
         central_widget.setLayout(main_layout)
 
         logo_label = QLabel()
-        pixmap = QPixmap("icon.ico")
-        pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        logo_label.setPixmap(pixmap)
+        # Иконка загружается один раз в main() и берётся у приложения
+        logo_label.setPixmap(QApplication.windowIcon().pixmap(100, 100))
         logo_label.setAlignment(Qt.AlignCenter)
         main_layout.addWidget(logo_label)
 
-        self.list_widget = QListWidget()
+        self.partner_model = PartnerListModel(self)
+        self.partner_model.request_more = self.load_next_page
+        self.page_after = None
+        self.list_view = QListView()
+        self.list_view.setModel(self.partner_model)
+        self.list_view.setItemDelegate(RequestItemDelegate(self.list_view))
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
         
         btn_layout = QHBoxLayout()
         self.add_btn = QPushButton("Добавить заявку")
@@ -151,106 +449,535 @@ class MainWindow(QMainWindow):
         self.delete_btn.clicked.connect(self.delete_selected_request)
         btn_layout.addWidget(self.delete_btn)
 
+        self.import_btn = QPushButton("Импорт заявок")
+        self.import_btn.setStyleSheet(f"background-color: {COLOR_ACCENT}; color: white; font-family: {FONT_FAMILY}; font-size: 14px;")
+        self.import_btn.clicked.connect(self.import_requests)
+        btn_layout.addWidget(self.import_btn)
+
+        self.export_btn = QPushButton("Экспорт заявок")
+        self.export_btn.setStyleSheet(f"background-color: {COLOR_ACCENT}; color: white; font-family: {FONT_FAMILY}; font-size: 14px;")
+        self.export_btn.clicked.connect(self.export_requests)
+        btn_layout.addWidget(self.export_btn)
+
+        self.materials_btn = QPushButton("Потребность в материалах")
+        self.materials_btn.setStyleSheet(f"background-color: {COLOR_ACCENT}; color: white; font-family: {FONT_FAMILY}; font-size: 14px;")
+        self.materials_btn.clicked.connect(self.show_materials)
+        btn_layout.addWidget(self.materials_btn)
+
+        self.diagnostics_btn = QPushButton("Диагностика")
+        self.diagnostics_btn.setStyleSheet(f"background-color: {COLOR_ACCENT}; color: white; font-family: {FONT_FAMILY}; font-size: 14px;")
+        self.diagnostics_btn.clicked.connect(self.show_diagnostics)
+        btn_layout.addWidget(self.diagnostics_btn)
+
         btn_layout.addStretch()
         main_layout.addLayout(btn_layout)
 
-        main_layout.addWidget(self.list_widget)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setTextVisible(False)
+        self.progress_bar.setMaximumHeight(6)
+        self.progress_bar.hide()
+        main_layout.addWidget(self.progress_bar)
+
+        # Поиск и сортировка выполняются на сервере
+        filter_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск по наименованию, директору, ИНН или телефону")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.load_requests)
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        filter_layout.addWidget(self.search_edit)
+
+        self.sort_combo = QComboBox()
+        for title, sort in (("По наименованию", "name"), ("По типу", "type"),
+                            ("По рейтингу", "rating"), ("По стоимости", "cost")):
+            self.sort_combo.addItem(title, sort)
+        self.sort_combo.currentIndexChanged.connect(self.load_requests)
+        filter_layout.addWidget(self.sort_combo)
+
+        self.order_btn = QPushButton("По возрастанию")
+        self.order_btn.setCheckable(True)
+        self.order_btn.toggled.connect(self.on_order_toggled)
+        filter_layout.addWidget(self.order_btn)
+        main_layout.addLayout(filter_layout)
+
+        # Заглушка на месте списка, пока не пришла первая порция партнеров
+        self.placeholder_label = QLabel("Загрузка заявок...")
+        self.placeholder_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.placeholder_label)
+        self.list_view.hide()
+        main_layout.addWidget(self.list_view)
 
         self.setStyleSheet(f"background-color: {COLOR_BG_MAIN}; font-family: {FONT_FAMILY}; color: black;")
 
+    # Схема БД обновляется до актуальной версии перед первой загрузкой списка
+    def migrate_schema(self):
+        self.set_loading(True)
+        self.tasks.start("migrate", migrate_task,
+                         on_done=lambda versions: self.load_requests(),
+                         on_error=self.on_migrate_failed)
+
+    def on_migrate_failed(self, error):
+        QMessageBox.warning(self, "Обновление схемы БД", f"Не удалось обновить схему базы данных:\n{str(error)}")
+        self.load_requests()
+
+    def set_loading(self, loading):
+        self.progress_bar.setVisible(loading)
+        self.edit_btn.setEnabled(not loading)
+        self.delete_btn.setEnabled(not loading)
+
+    def show_placeholder(self, text):
+        self.placeholder_label.setText(text)
+        self.placeholder_label.setVisible(bool(text))
+        self.list_view.setVisible(not text)
+
+    def on_order_toggled(self, descending):
+        self.order_btn.setText("По убыванию" if descending else "По возрастанию")
+        self.load_requests()
+
     def load_requests(self):
-        self.list_widget.clear()
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute("""
-                SELECT DISTINCT p.*
-                FROM [Партнеры] p
-                JOIN [Запросы партнеров] rp ON p.[Наименование партнера] = rp.[Партнер]
-            """)
-            partners = cursor.fetchall()
-            for p in partners:
-                partner_data = {
-                    "Наименование партнера": p[0],
-                    "Тип партнера": p[1],
-                    "Директор": p[2],
-                    "Электронная почта партнера": p[3],
-                    "Телефон партнера": p[4],
-                    "Юридический адрес партнера": p[5],
-                    "ИНН": p[6],
-                    "Рейтинг": p[7]
-                }
-                cost = calculate_request_cost(cursor, partner_data["Наименование партнера"])
-                item_widget = RequestItemWidget(partner_data, cost)
-                item = QListWidgetItem(self.list_widget)
-                item.setSizeHint(item_widget.sizeHint())
-                self.list_widget.addItem(item)
-                self.list_widget.setItemWidget(item, item_widget)
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка загрузки данных", f"Не удалось загрузить данные из базы:\n{str(e)}")
+        self.search_timer.stop()
+        self.partner_model.clear()
+        self.page_after = None
+        self.sync_version = None
+        self.tasks.cancel("sync")
+        self.set_loading(True)
+        self.list_span = start_span("ui:list_load")
+        self.start_page_load()
 
-    def add_request(self):
-        dialog = RequestEditDialog(self.conn, parent=self)
-        if dialog.exec() == QDialog.Accepted:
+    def load_next_page(self):
+        # Страница уже загружается - следующую запросим, когда она придёт
+        if not self.tasks.is_running("partners"):
+            self.start_page_load()
+
+    def start_page_load(self):
+        # Повторный вызов отменяет ещё не завершённую загрузку
+        self.tasks.start("partners", load_partners_page_task,
+                         self.search_edit.text().strip(), self.sort_combo.currentData(),
+                         self.order_btn.isChecked(), self.page_after,
+                         on_done=self.on_partners_page,
+                         on_error=self.on_load_failed)
+
+    def on_partners_page(self, result):
+        version, rows = result
+        if version is not None:
+            self.sync_version = version
+        if rows:
+            self.page_after = page_key(rows[-1], self.sort_combo.currentData())
+        self.partner_model.append_rows(rows, has_more=len(rows) == PAGE_SIZE)
+        self.list_span.finish()
+        self.set_loading(False)
+        self.update_placeholder()
+        startup_mark("first_page")
+
+    # Опрос журнала изменений: перечитываются только партнеры, изменённые другими клиентами
+    def poll_changes(self):
+        if (self.sync_version is None or self.isMinimized() or not self.isVisible()
+                or self.tasks.is_running("partners") or self.tasks.is_running("sync")):
+            return
+        self.tasks.start("sync", sync_changes_task, self.sync_version, self.search_edit.text().strip(),
+                         on_done=self.on_changes_loaded,
+                         on_error=lambda error: record_error("Ошибка синхронизации изменений", error))
+
+    def on_changes_loaded(self, result):
+        version, rows = result
+        if rows is None:
             self.load_requests()
+            return
+        for partner_name, row in rows.items():
+            self.partner_model.update_partner(partner_name, row)
+        self.sync_version = version
+        if rows:
+            self.update_placeholder()
+
+    def on_load_failed(self, error):
+        self.set_loading(False)
+        self.show_placeholder("Не удалось загрузить заявки")
+        QMessageBox.critical(self, "Ошибка загрузки данных", f"Не удалось загрузить данные из базы:\n{str(error)}")
+
+    def add_request(self):
+        dialog = RequestEditDialog(parent=self)
+        dialog.partner_saved.connect(self.refresh_partner)
+        dialog.exec()
+
+    # Перечитывает строку и стоимость одного партнера и обновляет её в списке на месте.
+    # Отбор тот же, что у списка: партнер, не подходящий под строку поиска, из списка убирается
+    def refresh_partner(self, partner_name):
+        self.tasks.start(f"refresh:{partner_name}", load_partner_row_task, partner_name,
+                         self.search_edit.text().strip(),
+                         on_done=self.on_partner_refreshed,
+                         on_error=self.on_refresh_failed)
+
+    def on_partner_refreshed(self, result):
+        self.partner_model.update_partner(*result)
+        self.update_placeholder()
+
+    def on_refresh_failed(self, error):
+        # Заявка уже сохранена, загруженный список остаётся на экране; строка обновится при синхронизации
+        QMessageBox.warning(self, "Ошибка загрузки данных",
+                            f"Не удалось обновить строку партнера в списке:\n{str(error)}")
+
+    def update_placeholder(self):
+        if not self.tasks.is_running("partners"):
+            if self.partner_model.rowCount():
+                self.show_placeholder("")
+            else:
+                self.show_placeholder("Ничего не найдено" if self.search_edit.text().strip() else "Заявок пока нет")
+
+    def selected_partner(self):
+        """Текущий партнер, если он выделен (при выделении нескольких - тот, на котором курсор)"""
+        current = self.list_view.currentIndex()
+        if current.isValid() and self.list_view.selectionModel().isSelected(current):
+            return current.data(PartnerRole)
+        selected = self.list_view.selectionModel().selectedIndexes()
+        return selected[0].data(PartnerRole) if selected else None
+
+    def selected_partners(self):
+        return [index.data(PartnerRole) for index in sorted(self.list_view.selectionModel().selectedIndexes(),
+                                                            key=lambda index: index.row())]
 
     def edit_selected_request(self):
-        selected_items = self.list_widget.selectedItems()
-        if not selected_items:
+        partner_data = self.selected_partner()
+        if not partner_data:
             QMessageBox.warning(self, "Выбор заявки", "Пожалуйста, выберите заявку для редактирования.")
             return
-        item = selected_items[0]
-        widget = self.list_widget.itemWidget(item)
-        if widget:
-            partner_name = widget.partner_data["Наименование партнера"]
-            dialog = RequestEditDialog(self.conn, partner_name=partner_name, parent=self)
-            if dialog.exec() == QDialog.Accepted:
-                self.load_requests()
+        partner_name = partner_data["Наименование партнера"]
+        dialog = RequestEditDialog(partner_name=partner_name, parent=self)
+        dialog.partner_saved.connect(self.refresh_partner)
+        dialog.exec()
 
+    # Удаление переводит партнеров в архив одной транзакцией; физически их удаляет
+    # пакетное задание (python cli.py purge-archived)
     def delete_selected_request(self):
-        selected_items = self.list_widget.selectedItems()
-        if not selected_items:
+        partner_names = [partner_data["Наименование партнера"] for partner_data in self.selected_partners()]
+        if not partner_names:
             QMessageBox.warning(self, "Удаление заявки", "Пожалуйста, выберите заявку для удаления.")
             return
-        item = selected_items[0]
-        widget = self.list_widget.itemWidget(item)
-        if not widget:
-            return
-        partner_name = widget.partner_data["Наименование партнера"]
-        reply = QMessageBox.question(self, "Подтверждение удаления",
-                                     f"Вы уверены, что хотите удалить все заявки партнера '{partner_name}'?",
-                                     QMessageBox.Yes | QMessageBox.No)
+        if len(partner_names) == 1:
+            question = f"Вы уверены, что хотите удалить все заявки партнера '{partner_names[0]}'?"
+        else:
+            question = f"Вы уверены, что хотите удалить все заявки выбранных партнеров ({len(partner_names)})?"
+        reply = QMessageBox.question(self, "Подтверждение удаления", question, QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            try:
-                cursor = self.conn.cursor()
-                cursor.execute("DELETE FROM [Запросы партнеров] WHERE [Партнер] = ?", partner_name)
-                cursor.execute("DELETE FROM [Партнеры] WHERE [Наименование партнера] = ?", partner_name)
-                self.conn.commit()
-                self.load_requests()
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при удалении данных:\n{str(e)}")
+            self.set_loading(True)
+            self.delete_span = start_span("ui:delete")
+            self.tasks.start("delete", archive_partners_task, partner_names,
+                             on_done=self.on_partners_deleted,
+                             on_error=self.on_delete_failed)
+
+    def on_partners_deleted(self, partner_names):
+        self.delete_span.finish()
+        self.set_loading(self.tasks.is_running("partners"))
+        self.partner_model.remove_partners(partner_names)
+        self.update_placeholder()
+
+    def on_delete_failed(self, error):
+        self.set_loading(self.tasks.is_running("partners"))
+        QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при удалении данных:\n{str(error)}")
+
+    def import_requests(self):
+        from PySide6.QtWidgets import QFileDialog
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт заявок", "",
+                                              "Заявки (*.csv *.jsonl);;Все файлы (*)")
+        if not path:
+            return
+        self.import_btn.setEnabled(False)
+        self.set_loading(True)
+        self.import_progress = create_task_progress(self, "Импорт заявок", self.cancel_import)
+        self.tasks.start("import", import_requests_task, path,
+                         on_chunk=lambda processed: self.import_progress.setLabelText(f"Обработано строк: {processed}"),
+                         on_done=self.on_import_finished,
+                         on_error=self.on_import_failed)
+
+    def cancel_import(self):
+        # Транзакция импорта откатывается в потоке задачи, заявки остаются прежними
+        self.tasks.cancel("import")
+        self.import_progress.hide()
+        self.import_btn.setEnabled(True)
+        self.set_loading(self.tasks.is_running("partners"))
+        self.statusBar().showMessage("Импорт отменён, заявки не изменены", 5000)
+
+    def on_import_finished(self, report):
+        self.import_progress.hide()
+        self.import_btn.setEnabled(True)
+        text = report.summary()
+        if report.errors:
+            text += "\n\n" + "\n".join(f"Строка {error.line}: {error.message}" for error in report.errors[:20])
+        QMessageBox.information(self, "Импорт заявок", text)
+        self.load_requests()
+
+    def on_import_failed(self, error):
+        self.import_progress.hide()
+        self.import_btn.setEnabled(True)
+        self.set_loading(self.tasks.is_running("partners"))
+        QMessageBox.critical(self, "Ошибка импорта", f"Не удалось импортировать заявки:\n{str(error)}")
+
+    def export_requests(self):
+        from PySide6.QtWidgets import QFileDialog, QInputDialog
+        # Что выгружать: выбранного партнера, партнеров по строке поиска или всех
+        scopes = []
+        partner_data = self.selected_partner()
+        if partner_data:
+            partner_name = partner_data["Наименование партнера"]
+            scopes.append((f"Партнер «{partner_name}»", partner_name, ""))
+        search = self.search_edit.text().strip()
+        if search:
+            scopes.append((f"Партнеры по поиску «{search}»", None, search))
+        scopes.append(("Все партнеры", None, ""))
+        if len(scopes) > 1:
+            title, ok = QInputDialog.getItem(self, "Экспорт заявок", "Выгрузить:", [scope[0] for scope in scopes], 0, False)
+            if not ok:
+                return
+            scope = next(scope for scope in scopes if scope[0] == title)
+        else:
+            scope = scopes[0]
+        formats = {"CSV (*.csv)": "csv", "Excel (*.xlsx)": "xlsx", "PDF (*.pdf)": "pdf"}
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Экспорт заявок", "заявки.csv", ";;".join(formats))
+        if not path:
+            return
+        file_format = formats.get(selected_filter, "csv")
+        if not path.lower().endswith("." + file_format):
+            path += "." + file_format
+        self.export_btn.setEnabled(False)
+        self.export_progress = create_task_progress(self, "Экспорт заявок", self.cancel_export)
+        self.tasks.start("export", export_requests_task, path, file_format, scope[1], scope[2],
+                         on_chunk=lambda exported: self.export_progress.setLabelText(f"Выгружено строк: {exported}"),
+                         on_done=self.on_export_finished,
+                         on_error=self.on_export_failed)
+
+    def cancel_export(self):
+        # Выгрузка прерывается в потоке задачи, недописанный файл удаляется (exporter.export_file)
+        self.tasks.cancel("export")
+        self.export_progress.hide()
+        self.export_btn.setEnabled(True)
+        self.statusBar().showMessage("Экспорт отменён", 5000)
+
+    def on_export_finished(self, report):
+        self.export_progress.hide()
+        self.export_btn.setEnabled(True)
+        QMessageBox.information(self, "Экспорт заявок", report.summary())
+
+    def on_export_failed(self, error):
+        self.export_progress.hide()
+        self.export_btn.setEnabled(True)
+        QMessageBox.critical(self, "Ошибка экспорта", f"Не удалось выгрузить заявки:\n{str(error)}")
+
+    def show_materials(self):
+        MaterialsDialog(self).exec()
+
+    def show_diagnostics(self):
+        DiagnosticsDialog(self).exec()
+
+    def closeEvent(self, event):
+        self.sync_timer.stop()
+        self.tasks.cancel_all()
+        super().closeEvent(event)
+
+# Окно хода длительной фоновой задачи (импорт, экспорт): объём заранее неизвестен,
+# кнопка "Отмена" и закрытие окна вызывают on_cancel
+def create_task_progress(parent, title, on_cancel):
+    progress = QProgressDialog("Подготовка...", "Отмена", 0, 0, parent)
+    progress.setWindowTitle(title)
+    progress.setMinimumDuration(0)
+    progress.setAutoClose(False)
+    progress.setAutoReset(False)
+    progress.canceled.connect(on_cancel)
+    progress.show()
+    return progress
+
+# Таблицы только для чтения в окнах отчётов: первый столбец - текст, остальные - числа
+def create_report_table(columns):
+    table = QTableWidget(0, len(columns))
+    table.setHorizontalHeaderLabels(columns)
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+    table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+    table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    table.setSelectionBehavior(QAbstractItemView.SelectRows)
+    return table
+
+def fill_report_table(table, rows, text_columns=1):
+    table.setRowCount(len(rows))
+    for row, values in enumerate(rows):
+        for column, value in enumerate(values):
+            item = QTableWidgetItem(str(value))
+            if column >= text_columns:
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            else:
+                item.setToolTip(str(value))
+            table.setItem(row, column, item)
+
+# Потребность в материалах для заявок активных партнеров (planning.py); расчёт выполняется в фоне
+class MaterialsDialog(QDialog):
+    TOTAL_COLUMNS = ["Тип материала", "Строк заявок", "Количество продукции", "Потребность"]
+    DETAIL_COLUMNS = ["Тип материала", "Тип продукции", "Строк заявок", "Количество продукции",
+                      "Коэффициент", "Брак, %", "Потребность"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Потребность в материалах")
+        self.setMinimumSize(900, 500)
+        self.tasks = TaskRunner()
+        layout = QVBoxLayout()
+
+        self.status_label = QLabel("Расчёт потребности в материалах...")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        layout.addWidget(QLabel("Итого по материалам"))
+        self.totals_table = create_report_table(self.TOTAL_COLUMNS)
+        layout.addWidget(self.totals_table)
+
+        layout.addWidget(QLabel("По типам продукции"))
+        self.details_table = create_report_table(self.DETAIL_COLUMNS)
+        layout.addWidget(self.details_table, 2)
+
+        btn_layout = QHBoxLayout()
+        self.refresh_btn = QPushButton("Пересчитать")
+        self.refresh_btn.clicked.connect(self.refresh)
+        btn_layout.addWidget(self.refresh_btn)
+        close_btn = QPushButton("Закрыть")
+        close_btn.clicked.connect(self.accept)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        self.refresh_btn.setEnabled(False)
+        self.status_label.setText("Расчёт потребности в материалах...")
+        self.tasks.start("materials", material_requirements_task,
+                         on_done=self.on_requirements_loaded,
+                         on_error=self.on_requirements_failed)
+
+    def on_requirements_loaded(self, requirements):
+        self.refresh_btn.setEnabled(True)
+        no_material = "Не указан"
+        fill_report_table(self.totals_table, [
+            (material or no_material, lines, quantity, amount)
+            for material, (lines, quantity, amount) in material_totals(requirements).items()
+        ])
+        fill_report_table(self.details_table, [
+            (requirement.material or no_material, requirement.product_type, requirement.lines,
+             requirement.quantity, requirement.coefficient, requirement.defect_percent, requirement.amount)
+            for requirement in requirements
+        ], text_columns=2)
+        self.status_label.setText("Для невыполненных заявок активных партнеров: количество продукции × "
+                                  "коэффициент типа продукции × (1 + процент брака материала / 100), "
+                                  "с округлением вверх до целых единиц" if requirements else "Заявок нет")
+
+    def on_requirements_failed(self, error):
+        self.refresh_btn.setEnabled(True)
+        self.status_label.setText("")
+        QMessageBox.critical(self, "Ошибка базы данных", f"Не удалось рассчитать потребность в материалах:\n{str(error)}")
+
+    def done(self, result):
+        self.tasks.cancel_all()
+        super().done(result)
+
+# Окно диагностики: замеры запросов и операций интерфейса, подозрения на N+1 и ошибки
+class DiagnosticsDialog(QDialog):
+    QUERY_COLUMNS = ["Запрос", "Выполнений", "Строк", "Среднее, мс", "p95, мс", "Макс., мс", "Всего, мс"]
+    OPERATION_COLUMNS = ["Операция", "Выполнений", "Среднее, мс", "p50, мс", "p95, мс", "Макс., мс"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Диагностика")
+        self.setMinimumSize(900, 600)
+        layout = QVBoxLayout()
+
+        layout.addWidget(QLabel("Операции"))
+        self.operations_table = create_report_table(self.OPERATION_COLUMNS)
+        layout.addWidget(self.operations_table)
+
+        layout.addWidget(QLabel("Запросы к базе данных (по суммарному времени)"))
+        self.queries_table = create_report_table(self.QUERY_COLUMNS)
+        layout.addWidget(self.queries_table, 2)
+
+        self.events_label = QLabel()
+        self.events_label.setWordWrap(True)
+        self.events_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.events_label)
+
+        btn_layout = QHBoxLayout()
+        for title, handler in (("Обновить", self.refresh), ("Экспорт JSON", self.export_json),
+                               ("Сбросить", self.reset), ("Закрыть", self.accept)):
+            button = QPushButton(title)
+            button.clicked.connect(handler)
+            btn_layout.addWidget(button)
+        layout.addLayout(btn_layout)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        fill_report_table(self.operations_table, [
+            (op["operation"], op["count"], op["avg_ms"], op["p50_ms"], op["p95_ms"], op["max_ms"])
+            for op in snapshot["operations"]
+        ])
+        fill_report_table(self.queries_table, [
+            (query["query"], query["count"], query["rows"], query["avg_ms"], query["p95_ms"],
+             query["max_ms"], query["total_ms"])
+            for query in snapshot["queries"]
+        ])
+        lines = [f"N+1 в '{event['operation']}': {event['count']} раз - {event['query'][:120]}"
+                 for event in snapshot["n_plus_one"][-5:]]
+        lines += [f"{event['context']}: {event['error']}" for event in snapshot["errors"][-5:]]
+        self.events_label.setText("\n".join(lines) or "Подозрений на N+1 и ошибок нет")
+
+    def export_json(self):
+        from PySide6.QtWidgets import QFileDialog
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт диагностики", "diagnostics.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            metrics.export_json(path)
+        except Exception as e:
+            QMessageBox.critical(self, "Экспорт диагностики", f"Не удалось сохранить файл:\n{str(e)}")
+
+    def reset(self):
+        metrics.reset()
+        self.refresh()
 
 # Диалог редактирования заявок
 class RequestEditDialog(QDialog):
-    def __init__(self, conn, partner_name=None, parent=None):
+    # Наименование партнера, заявка которого сохранена
+    partner_saved = Signal(str)
+
+    def __init__(self, partner_name=None, parent=None):
         super().__init__(parent)
-        self.conn = conn
+        # От создания диалога до загрузки каталога и строк заявки
+        self.open_span = start_span("ui:dialog_open")
+        self.save_span = None
+        self.tasks = TaskRunner()
         self.partner_name = partner_name
         self.setWindowTitle("Заявка партнера" if partner_name else "Новая заявка партнера")
         self.setMinimumSize(700, 600)
         self.setModal(True)
-        self.products = []
-        self.materials_defect = {}
+        self.catalog = ProductCatalog()
+        # Наименования продукции, уже добавленной в заявку
+        self.request_products = set()
+        # Точные стоимости строк таблицы (см. pricing.py), по одной на строку, и их сумма.
+        # Сумма поддерживается при каждом изменении строки, а не пересчитывается по таблице
+        self.line_costs = []
+        # Принятые количества строк: к ним возвращается ячейка после неверного ввода
+        self.line_quantities = []
+        self.total_exact = 0
         self.request_items = []
+        # Версия партнера, с которой начато редактирование (оптимистичная блокировка при сохранении)
+        self.partner_version = None
         self.custom_type_visible = False
         self.init_ui()
         self.load_products_and_defects()
         if self.partner_name:
             self.load_partner_data()
-            self.load_request_items()
         else:
             self.rating_spin.setValue(100)
             self.custom_type_edit.hide()
             self.custom_type_label.hide()
+        self.update_loading_state()
 
     def init_ui(self):
         main_layout = QVBoxLayout()
@@ -354,9 +1081,17 @@ class RequestEditDialog(QDialog):
         # Компактный интерфейс добавления продукции
         add_product_layout = QHBoxLayout()
         
-        self.product_combo = QComboBox()
-        self.product_combo.setMinimumWidth(200)
-        add_product_layout.addWidget(self.product_combo)
+        # Поиск продукции по наименованию или артикулу: в модели подсказок только найденные варианты
+        self.product_edit = QLineEdit()
+        self.product_edit.setMinimumWidth(200)
+        self.product_edit.setPlaceholderText("Наименование или артикул продукции")
+        self.product_matches = QStringListModel(self)
+        self.product_completer = QCompleter(self.product_matches, self)
+        self.product_completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.product_completer.setMaxVisibleItems(15)
+        self.product_edit.setCompleter(self.product_completer)
+        self.product_edit.textEdited.connect(self.on_product_text_edited)
+        add_product_layout.addWidget(self.product_edit)
         
         self.quantity_spin = QSpinBox()
         self.quantity_spin.setMinimum(1)
@@ -377,7 +1112,9 @@ class RequestEditDialog(QDialog):
         self.table.setHorizontalHeaderLabels(["Продукция", "Количество", "Стоимость с учетом брака"])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # Редактируется только количество (ячейки остальных столбцов без флага редактирования)
+        self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+        self.table.itemChanged.connect(self.on_item_changed)
         products_layout.addWidget(self.table)
         
         # Кнопки управления таблицей
@@ -393,11 +1130,21 @@ class RequestEditDialog(QDialog):
         products_group.setLayout(products_layout)
         main_layout.addWidget(products_group)
         
+        # Состояние фоновой загрузки
+        self.loading_label = QLabel("Загрузка данных...")
+        self.loading_label.hide()
+        main_layout.addWidget(self.loading_label)
+
         # Итоговая стоимость
         self.total_cost_label = QLabel("Итоговая стоимость: 0.00 ₽")
         self.total_cost_label.setFont(QFont(FONT_FAMILY, 11, QFont.Bold))
         self.total_cost_label.setAlignment(Qt.AlignRight)
         main_layout.addWidget(self.total_cost_label)
+        # Перерисовка итога откладывается до возврата в цикл событий: серия правок - одна перерисовка
+        self.total_timer = QTimer(self)
+        self.total_timer.setSingleShot(True)
+        self.total_timer.setInterval(0)
+        self.total_timer.timeout.connect(self.repaint_total_cost)
         
         # Кнопки сохранения/отмены
         btn_layout = QHBoxLayout()
@@ -464,63 +1211,84 @@ class RequestEditDialog(QDialog):
             return self.custom_type_edit.text().strip()
         return self.type_combo.currentText()
 
+    def update_loading_state(self):
+        loading = any(self.tasks.is_running(key) for key in ("catalog", "partner", "items", "save"))
+        self.loading_label.setVisible(loading)
+        self.save_btn.setEnabled(not loading)
+        self.add_product_btn.setEnabled(not loading)
+        if not loading:
+            self.open_span.finish()
+
+    def start_task(self, key, fn, *args, on_done=None):
+        def finished(result):
+            # Сначала обработчик: он может запустить следующую загрузку (строки заявки после каталога)
+            if on_done:
+                on_done(result)
+            self.update_loading_state()
+
+        def failed(error):
+            self.update_loading_state()
+            self.on_task_failed(key, error)
+
+        self.tasks.start(key, fn, *args, on_done=finished, on_error=failed)
+        self.update_loading_state()
+
+    def on_task_failed(self, key, error):
+        if key == "catalog":
+            QMessageBox.warning(self, "Ошибка загрузки данных", f"Не удалось загрузить данные продукции:\n{str(error)}")
+            self.catalog = ProductCatalog()
+        elif key == "save" and isinstance(error, PartnerExistsError):
+            QMessageBox.warning(self, "Ошибка", str(error))
+        elif key == "save" and isinstance(error, SaveConflictError):
+            self.resolve_save_conflict(error)
+        elif key == "save":
+            QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при сохранении данных:\n{str(error)}")
+        else:
+            QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при загрузке данных партнера:\n{str(error)}")
+            self.reject()
+
     def load_products_and_defects(self):
-        cursor = self.conn.cursor()
-        try:
-            # Загрузка процентов брака материалов
-            cursor.execute("SELECT [Тип материала], [Процент брака материала] FROM [Типы материалов]")
-            for row in cursor.fetchall():
-                self.materials_defect[row[0]] = row[1]
-            
-            # Загрузка продукции с типами
-            cursor.execute("""
-                SELECT p.[Наименование продукции], p.[Минимальная стоимость для партнера], tp.[Тип продукции]
-                FROM [Продукция] p
-                JOIN [Типы продукции] tp ON p.[Тип продукции] = tp.[Тип продукции]
-            """)
-            self.products = cursor.fetchall()
-            self.product_combo.clear()
-            for p in self.products:
-                self.product_combo.addItem(p[0])
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка загрузки данных", f"Не удалось загрузить данные продукции:\n{str(e)}")
-            self.products = []
+        # Свежий каталог из общего кэша применяется сразу, без обращения к БД
+        catalog = catalog_cache.peek()
+        if catalog is not None:
+            self.on_catalog_loaded(catalog)
+            return
+        self.start_task("catalog", load_catalog_task, on_done=self.on_catalog_loaded)
+
+    def on_catalog_loaded(self, result):
+        self.catalog = result
+        if self.product_edit.text():
+            self.on_product_text_edited(self.product_edit.text())
+        # Стоимость строк заявки считается по каталогу, поэтому строки грузятся после него
+        if self.partner_name:
+            self.load_request_items()
 
     def load_partner_data(self):
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(
-                "SELECT [Тип партнера], [Директор], [Юридический адрес партнера], "
-                "[Телефон партнера], [Электронная почта партнера], [Рейтинг], [ИНН] "
-                "FROM [Партнеры] WHERE [Наименование партнера] = ?", 
-                self.partner_name
-            )
-            partner_data = cursor.fetchone()
-            
-            if partner_data:
-                partner_type = partner_data[0]
-                if partner_type in ["Оптовый", "Розничный", "Интернет-магазин"]:
-                    self.type_combo.setCurrentText(partner_type)
-                else:
-                    self.type_combo.setCurrentText("Другой")
-                    self.custom_type_edit.setText(partner_type)
-                
-                self.name_edit.setText(self.partner_name)
-                self.director_edit.setText(partner_data[1])
-                self.address_edit.setText(partner_data[2])
-                self.phone_edit.setText(partner_data[3])
-                self.email_edit.setText(partner_data[4])
-                self.rating_spin.setValue(partner_data[5])
-                self.inn_edit.setText(partner_data[6])
-                
-                # Показать все поля при редактировании
-                for field in self.additional_fields:
-                    field.show()
+        self.start_task("partner", load_partner_task, self.partner_name, on_done=self.on_partner_loaded)
+
+    def on_partner_loaded(self, partner_data):
+        if partner_data:
+            partner_type = partner_data[0]
+            if partner_type in ["Оптовый", "Розничный", "Интернет-магазин"]:
+                self.type_combo.setCurrentText(partner_type)
             else:
-                QMessageBox.warning(self, "Ошибка", "Партнер не найден в базе данных")
-                self.reject()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при загрузке данных партнера:\n{str(e)}")
+                self.type_combo.setCurrentText("Другой")
+                self.custom_type_edit.setText(partner_type)
+
+            self.name_edit.setText(self.partner_name)
+            self.director_edit.setText(partner_data[1])
+            self.address_edit.setText(partner_data[2])
+            self.phone_edit.setText(partner_data[3])
+            self.email_edit.setText(partner_data[4])
+            self.rating_spin.setValue(partner_data[5])
+            self.inn_edit.setText(partner_data[6])
+            self.partner_version = partner_data[7]
+
+            # Показать все поля при редактировании
+            for field in self.additional_fields:
+                field.show()
+        else:
+            QMessageBox.warning(self, "Ошибка", "Партнер не найден в базе данных")
             self.reject()
 
     def validate_partner_data(self):
@@ -550,35 +1318,100 @@ class RequestEditDialog(QDialog):
         return True
 
     def load_request_items(self):
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "SELECT [Продукция], [Количество] FROM [Запросы партнеров] WHERE [Партнер] = ?", 
-            self.partner_name
-        )
-        self.request_items = cursor.fetchall()
-        self.table.setRowCount(0)
-        for product_name, quantity in self.request_items:
-            self.add_product_to_table(product_name, quantity)
+        self.start_task("items", load_request_items_task, self.partner_name, on_done=self.on_request_items_loaded)
+
+    def on_request_items_loaded(self, items):
+        self.request_items = items
+        self.fill_table((product_name, quantity) for _, product_name, quantity, _ in items)
+
+    def fill_table(self, items):
+        # Массовая загрузка: без сигналов и перерисовки таблицы, итог пересчитывается один раз
+        self.table.setUpdatesEnabled(False)
+        self.table.blockSignals(True)
+        try:
+            self.table.setRowCount(0)
+            self.request_products.clear()
+            self.line_costs.clear()
+            self.line_quantities.clear()
+            for product_name, quantity in items:
+                self.add_product_to_table(product_name, quantity, update_total=False)
+        finally:
+            self.table.blockSignals(False)
+            self.table.setUpdatesEnabled(True)
+        self.recompute_total_cost()
+
+    def resolve_save_conflict(self, error):
+        """Заявку сохранил другой пользователь: перезаписать, объединить изменения или отменить"""
+        if error.lines is None:
+            QMessageBox.warning(self, "Конфликт сохранения", str(error))
+            return
+        mine = self.table_items()
+        merged, conflicts = merge_request_items(self.request_items, mine, error.lines)
+        text = str(error)
+        if conflicts:
+            text += "\n\nИзменены обоими пользователями:\n" + "\n".join(conflicts)
+        box = QMessageBox(QMessageBox.Warning, "Конфликт сохранения", text, parent=self)
+        box.setInformativeText("«Перезаписать» сохранит заявку в вашем виде, «Объединить» добавит в таблицу "
+                               "изменения другого пользователя для проверки перед сохранением.")
+        overwrite_btn = box.addButton("Перезаписать", QMessageBox.DestructiveRole)
+        merge_btn = box.addButton("Объединить", QMessageBox.AcceptRole)
+        box.addButton("Отмена", QMessageBox.RejectRole)
+        box.setDefaultButton(merge_btn)
+        box.exec()
+        if box.clickedButton() not in (overwrite_btn, merge_btn):
+            return
+        # Дальше редактирование идёт от текущего состояния в БД
+        self.request_items = error.lines
+        self.partner_version = error.partner_version
+        if box.clickedButton() is overwrite_btn:
+            self.save_request()
+        else:
+            self.fill_table(merged)
+
+    def table_items(self):
+        return [
+            (self.table.item(row, 0).text(), self.line_quantities[row])
+            for row in range(self.table.rowCount())
+        ]
+
+    def on_product_text_edited(self, text):
+        self.product_matches.setStringList(self.catalog.search(text))
+        if self.product_matches.rowCount():
+            self.product_completer.complete()
+
+    def selected_product(self):
+        """Наименование продукции из строки поиска: точное наименование или артикул"""
+        text = self.product_edit.text().strip()
+        if text in self.catalog:
+            return text
+        product = self.catalog.get_by_article(int(text)) if text.isdigit() else None
+        return product.name if product else None
 
     def add_product(self):
-        product_name = self.product_combo.currentText()
+        product_name = self.selected_product()
         quantity = self.quantity_spin.value()
+        if product_name is None:
+            QMessageBox.warning(self, "Продукция", "Выберите продукцию из списка подсказок.")
+            return
         
         # Проверяем, не добавлен ли уже этот продукт
-        for row in range(self.table.rowCount()):
-            if self.table.item(row, 0).text() == product_name:
-                QMessageBox.warning(self, "Дублирование", "Этот продукт уже добавлен в заявку")
-                return
-                
+        if product_name in self.request_products:
+            QMessageBox.warning(self, "Дублирование", "Этот продукт уже добавлен в заявку")
+            return
+
         self.add_product_to_table(product_name, quantity)
+        self.product_edit.clear()
         self.quantity_spin.setValue(1)
 
-    def add_product_to_table(self, product_name, quantity):
+    def add_product_to_table(self, product_name, quantity, update_total=True):
+        """update_total=False - итог пересчитает вызывающий код (массовая загрузка)"""
         row = self.table.rowCount()
         self.table.insertRow(row)
+        read_only = Qt.ItemIsSelectable | Qt.ItemIsEnabled
         
         # Название продукта
         name_item = QTableWidgetItem(product_name)
+        name_item.setFlags(read_only)
         self.table.setItem(row, 0, name_item)
         
         # Количество
@@ -586,34 +1419,49 @@ class RequestEditDialog(QDialog):
         quantity_item.setTextAlignment(Qt.AlignCenter)
         self.table.setItem(row, 1, quantity_item)
         
-        # Стоимость с учетом брака материала
-        cost = self.calculate_product_cost(product_name, quantity)
-        cost_item = QTableWidgetItem(f"{cost:.2f} ₽")
+        # Стоимость с учетом брака материала; точное значение хранится в self.line_costs
+        cost_item = QTableWidgetItem()
+        cost_item.setFlags(read_only)
         cost_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
         self.table.setItem(row, 2, cost_item)
+        line_cost = self.catalog.line_exact(product_name, quantity)
+        cost_item.setText(f"{exact_to_decimal(line_cost):.2f} ₽")
+        self.line_costs.append(line_cost)
+        self.line_quantities.append(quantity)
+        self.request_products.add(product_name)
         
-        self.update_total_cost()
+        if update_total:
+            self.total_exact += line_cost
+            self.update_total_cost()
 
-    def calculate_product_cost(self, product_name, quantity):
-        """Расчет стоимости с учетом процента брака материала"""
+    def on_item_changed(self, item):
+        row = item.row()
+        # Строка ещё заполняется в add_product_to_table - её стоимость пока не записана
+        if item.column() != 1 or row >= len(self.line_costs):
+            return
         try:
-            # Находим продукт
-            product = next(p for p in self.products if p[0] == product_name)
-            base_cost = float(product[1])
-            product_type = product[2]
-            
-            # Получаем процент брака для типа материала
-            defect_percent = self.materials_defect.get(product_type, 0.0)
-            
-            # Рассчитываем стоимость с учетом брака
-            adjusted_cost = base_cost * (1 + defect_percent / 100.0)
-            total_cost = adjusted_cost * quantity
-            return total_cost
-        except Exception as e:
-            print(f"Ошибка расчета стоимости продукта: {str(e)}")
-            # Fallback: базовая стоимость без учета брака
-            product = next(p for p in self.products if p[0] == product_name)
-            return float(product[1]) * quantity
+            quantity = int(item.text())
+        except ValueError:
+            quantity = 0
+        if quantity < 1:
+            QMessageBox.warning(self, "Ошибка", "Количество должно быть целым числом больше нуля.")
+            # Возвращаем последнее принятое количество строки
+            self.table.blockSignals(True)
+            item.setText(str(self.line_quantities[row]))
+            self.table.blockSignals(False)
+            return
+        self.set_line_quantity(row, quantity)
+
+    def set_line_quantity(self, row, quantity):
+        """Новое количество строки: итог меняется на разницу стоимостей строки"""
+        line_cost = self.catalog.line_exact(self.table.item(row, 0).text(), quantity)
+        self.total_exact += line_cost - self.line_costs[row]
+        self.line_costs[row] = line_cost
+        self.line_quantities[row] = quantity
+        self.table.blockSignals(True)
+        self.table.item(row, 2).setText(f"{exact_to_decimal(line_cost):.2f} ₽")
+        self.table.blockSignals(False)
+        self.update_total_cost()
 
     def remove_selected_product(self):
         selected_rows = self.table.selectionModel().selectedRows()
@@ -622,16 +1470,25 @@ class RequestEditDialog(QDialog):
             return
             
         for row in sorted([index.row() for index in selected_rows], reverse=True):
+            self.request_products.discard(self.table.item(row, 0).text())
+            self.total_exact -= self.line_costs.pop(row)
+            self.line_quantities.pop(row)
             self.table.removeRow(row)
             
         self.update_total_cost()
 
+    def recompute_total_cost(self):
+        """Полный пересчёт итога по сохранённым стоимостям строк - только после массовых операций"""
+        self.total_exact = sum(self.line_costs)
+        self.update_total_cost()
+
     def update_total_cost(self):
-        total = 0.0
-        for row in range(self.table.rowCount()):
-            cost_text = self.table.item(row, 2).text().replace(" ₽", "")
-            total += float(cost_text)
-            
+        # Сама перерисовка отложена: несколько изменений подряд дают одно обновление надписи
+        self.total_timer.start()
+
+    def repaint_total_cost(self):
+        # Точный итог округляется до копеек один раз, как в SQL
+        total = exact_to_decimal(self.total_exact)
         self.total_cost_label.setText(f"Итоговая стоимость: {total:.2f} ₽")
 
     def save_request(self):
@@ -642,72 +1499,40 @@ class RequestEditDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Добавьте хотя бы один продукт в заявку.")
             return
             
-        cursor = self.conn.cursor()
-        try:
-            partner_name = self.name_edit.text().strip()
-            partner_type = self.get_selected_type()
-            director = self.director_edit.text().strip()
-            email = self.email_edit.text().strip() if self.email_edit.isVisible() else ""
-            phone = self.phone_edit.text().strip() if self.phone_edit.isVisible() else ""
-            address = self.address_edit.text().strip() if self.address_edit.isVisible() else ""
-            inn = self.inn_edit.text().strip() if self.inn_edit.isVisible() else ""
-            rating = self.rating_spin.value() if self.rating_spin.isVisible() else 100
-            
-            if not self.partner_name:
-                cursor.execute(
-                    "SELECT COUNT(*) FROM [Партнеры] WHERE [Наименование партнера] = ?", 
-                    partner_name
-                )
-                if cursor.fetchone()[0] > 0:
-                    QMessageBox.warning(self, "Ошибка", "Партнер с таким наименованием уже существует.")
-                    return
-                
-                cursor.execute("""
-                    INSERT INTO [Партнеры] (
-                        [Наименование партнера], [Тип партнера], [Директор], 
-                        [Электронная почта партнера], [Телефон партнера], 
-                        [Юридический адрес партнера], [ИНН], [Рейтинг]
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    partner_name,
-                    partner_type,
-                    director,
-                    email,
-                    phone,
-                    address,
-                    inn,
-                    rating
-                ))
-                self.partner_name = partner_name
-            else:
-                # При редактировании обновляем только рейтинг
-                cursor.execute("""
-                    UPDATE [Партнеры] SET [Рейтинг] = ?
-                    WHERE [Наименование партнера] = ?
-                """, (rating, self.partner_name))
-            
-            # Обновляем список продукции
-            cursor.execute("DELETE FROM [Запросы партнеров] WHERE [Партнер] = ?", self.partner_name)
-            
-            for row in range(self.table.rowCount()):
-                product_name = self.table.item(row, 0).text()
-                quantity = int(self.table.item(row, 1).text())
-                
-                cursor.execute("""
-                    INSERT INTO [Запросы партнеров] (
-                        [Продукция], [Партнер], [Количество]
-                    ) VALUES (?, ?, ?)
-                """, (product_name, self.partner_name, quantity))
-            
-            self.conn.commit()
-            self.accept()
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка базы данных", f"Ошибка при сохранении данных:\n{str(e)}")
-            self.conn.rollback()
+        partner = {
+            "Наименование партнера": self.name_edit.text().strip(),
+            "Тип партнера": self.get_selected_type(),
+            "Директор": self.director_edit.text().strip(),
+            "Электронная почта партнера": self.email_edit.text().strip() if self.email_edit.isVisible() else "",
+            "Телефон партнера": self.phone_edit.text().strip() if self.phone_edit.isVisible() else "",
+            "Юридический адрес партнера": self.address_edit.text().strip() if self.address_edit.isVisible() else "",
+            "ИНН": self.inn_edit.text().strip() if self.inn_edit.isVisible() else "",
+            "Рейтинг": self.rating_spin.value() if self.rating_spin.isVisible() else 100
+        }
+        if self.partner_name:
+            partner["Наименование партнера"] = self.partner_name
+        items = self.table_items()
+        self.save_span = start_span("ui:save")
+        self.start_task("save", save_request_task, not self.partner_name, partner, items, self.request_items,
+                        self.partner_version, on_done=self.on_request_saved)
+
+    def on_request_saved(self, partner_name):
+        self.save_span.finish()
+        self.partner_name = partner_name
+        self.partner_saved.emit(partner_name)
+        self.accept()
+
+    def done(self, result):
+        # Во время сохранения диалог не закрывается, иначе результат транзакции будет потерян
+        if result == QDialog.Rejected and self.tasks.is_running("save"):
+            return
+        self.tasks.cancel_all()
+        super().done(result)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    app.setWindowIcon(QIcon(ICON_PATH))
     window = MainWindow()
     window.show()
+    QTimer.singleShot(0, lambda: startup_mark("window"))
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,270 @@
+# Версионированные миграции схемы PartnerProductsDB.
+# Каждая миграция применяется один раз; номер записывается в [Версия схемы].
+# Скрипты написаны идемпотентно, поэтому повторный запуск на частично обновлённой базе безопасен.
+
+from catalog import catalog_cache
+
+VERSION_TABLE = {
+    "mssql": ["""
+        IF OBJECT_ID(N'[Версия схемы]', N'U') IS NULL
+        CREATE TABLE [Версия схемы] (
+            [Версия] INT PRIMARY KEY,
+            [Описание] NVARCHAR(255) NOT NULL,
+            [Применена] DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+        )
+    """],
+    "sqlite": ["""
+        CREATE TABLE IF NOT EXISTS [Версия схемы] (
+            [Версия] INTEGER PRIMARY KEY,
+            [Описание] TEXT NOT NULL,
+            [Применена] TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """],
+}
+
+def _mssql_index(name, table, sql):
+    return f"""
+        IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'{name}' AND object_id = OBJECT_ID(N'{table}'))
+        {sql}
+    """
+
+def _sqlite_add_column(table, column, definition):
+    """ALTER TABLE ... ADD COLUMN для SQLite, пропускаемый, если столбец уже есть.
+    DDL в SQLite не откатывается вместе с миграцией, поэтому после прерванного запуска столбец может остаться"""
+    def apply(cursor):
+        cursor.execute(f"PRAGMA table_info([{table}])")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE [{table}] ADD COLUMN [{column}] {definition}")
+    return apply
+
+def _sqlite_backfill_totals(cursor):
+    # DECIMAL в SQLite хранится как REAL, поэтому итоги считаются точно в pricing.py, как и при
+    # последующих пересчётах (SqliteRepository); repository импортирует этот модуль, импорт - здесь
+    from repository import SqliteRepository
+    SqliteRepository().backfill_totals(cursor)
+
+# Итоги по партнеру из строк заявок; {filter} - необязательный отбор по партнеру
+PARTNER_TOTALS_SELECT = """
+    SELECT rp.[Партнер], COUNT(*), SUM(rp.[Количество]),
+        SUM(rp.[Количество] * pr.[Минимальная стоимость для партнера] *
+            (1 + COALESCE(m.[Процент брака материала], 0) / 100.0))
+    FROM [Запросы партнеров] rp
+    JOIN [Продукция] pr ON rp.[Продукция] = pr.[Наименование продукции]
+    LEFT JOIN [Типы материалов] m ON pr.[Тип продукции] = m.[Тип материала]
+    {filter}
+    GROUP BY rp.[Партнер]
+"""
+PARTNER_TOTALS_INSERT = (
+    "INSERT INTO [Итоги партнеров] ([Партнер], [Число строк], [Количество], [Стоимость]) "
+    + PARTNER_TOTALS_SELECT
+)
+
+MIGRATIONS = [
+    (1, "Таблица [Типы материалов] с процентом брака", {
+        "mssql": ["""
+            IF OBJECT_ID(N'[Типы материалов]', N'U') IS NULL
+            CREATE TABLE [Типы материалов] (
+                [Тип материала] NVARCHAR(50) PRIMARY KEY,
+                [Процент брака материала] DECIMAL(5,2) NOT NULL
+            )
+        """],
+        "sqlite": ["""
+            CREATE TABLE IF NOT EXISTS [Типы материалов] (
+                [Тип материала] NVARCHAR(50) PRIMARY KEY,
+                [Процент брака материала] DECIMAL(5,2) NOT NULL
+            )
+        """],
+    }),
+    (2, "Покрывающие индексы для отбора заявок по партнеру и соединения с продукцией", {
+        "mssql": [
+            _mssql_index("IX_Запросы_партнеров_Партнер", "[Запросы партнеров]", """
+                CREATE INDEX [IX_Запросы_партнеров_Партнер]
+                ON [Запросы партнеров] ([Партнер]) INCLUDE ([Продукция], [Количество])
+            """),
+            _mssql_index("IX_Запросы_партнеров_Продукция", "[Запросы партнеров]", """
+                CREATE INDEX [IX_Запросы_партнеров_Продукция]
+                ON [Запросы партнеров] ([Продукция]) INCLUDE ([Партнер], [Количество])
+            """),
+            _mssql_index("IX_Продукция_Наименование", "[Продукция]", """
+                CREATE INDEX [IX_Продукция_Наименование]
+                ON [Продукция] ([Наименование продукции])
+                INCLUDE ([Минимальная стоимость для партнера], [Тип продукции])
+            """),
+        ],
+        "sqlite": [
+            """CREATE INDEX IF NOT EXISTS [IX_Запросы_партнеров_Партнер]
+               ON [Запросы партнеров] ([Партнер], [Продукция], [Количество])""",
+            """CREATE INDEX IF NOT EXISTS [IX_Запросы_партнеров_Продукция]
+               ON [Запросы партнеров] ([Продукция], [Партнер], [Количество])""",
+            """CREATE INDEX IF NOT EXISTS [IX_Продукция_Наименование]
+               ON [Продукция] ([Наименование продукции], [Минимальная стоимость для партнера], [Тип продукции])""",
+        ],
+    }),
+    (3, "Материализованные итоги заявок по партнерам", {
+        "mssql": [
+            """
+            IF OBJECT_ID(N'[Итоги партнеров]', N'U') IS NULL
+            CREATE TABLE [Итоги партнеров] (
+                [Партнер] NVARCHAR(255) PRIMARY KEY REFERENCES [Партнеры]([Наименование партнера]),
+                [Число строк] INT NOT NULL,
+                [Количество] BIGINT NOT NULL,
+                [Стоимость] DECIMAL(18,2) NOT NULL
+            )
+            """,
+            "DELETE FROM [Итоги партнеров]",
+            PARTNER_TOTALS_INSERT.format(filter=""),
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS [Итоги партнеров] (
+                [Партнер] NVARCHAR(255) PRIMARY KEY REFERENCES [Партнеры]([Наименование партнера]),
+                [Число строк] INTEGER NOT NULL,
+                [Количество] INTEGER NOT NULL,
+                [Стоимость] DECIMAL(18,2) NOT NULL
+            )
+            """,
+            _sqlite_backfill_totals,
+        ],
+    }),
+    (4, "Индексы сортировки списка партнеров (с наименованием для пагинации по ключу)", {
+        "mssql": [
+            _mssql_index("IX_Итоги_партнеров_Стоимость", "[Итоги партнеров]", """
+                CREATE INDEX [IX_Итоги_партнеров_Стоимость]
+                ON [Итоги партнеров] ([Стоимость], [Партнер])
+            """),
+            _mssql_index("IX_Партнеры_Тип", "[Партнеры]", """
+                CREATE INDEX [IX_Партнеры_Тип]
+                ON [Партнеры] ([Тип партнера], [Наименование партнера])
+            """),
+            _mssql_index("IX_Партнеры_Рейтинг", "[Партнеры]", """
+                CREATE INDEX [IX_Партнеры_Рейтинг]
+                ON [Партнеры] ([Рейтинг], [Наименование партнера])
+            """),
+        ],
+        "sqlite": [
+            """CREATE INDEX IF NOT EXISTS [IX_Итоги_партнеров_Стоимость]
+               ON [Итоги партнеров] ([Стоимость], [Партнер])""",
+            """CREATE INDEX IF NOT EXISTS [IX_Партнеры_Тип]
+               ON [Партнеры] ([Тип партнера], [Наименование партнера])""",
+            """CREATE INDEX IF NOT EXISTS [IX_Партнеры_Рейтинг]
+               ON [Партнеры] ([Рейтинг], [Наименование партнера])""",
+        ],
+    }),
+    (5, "Журнал изменений заявок для синхронизации клиентов", {
+        "mssql": ["""
+            IF OBJECT_ID(N'[Журнал изменений]', N'U') IS NULL
+            CREATE TABLE [Журнал изменений] (
+                [Версия] BIGINT IDENTITY(1,1) PRIMARY KEY,
+                [Партнер] NVARCHAR(255) NULL,
+                [Изменено] DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+            )
+        """],
+        "sqlite": ["""
+            CREATE TABLE IF NOT EXISTS [Журнал изменений] (
+                [Версия] INTEGER PRIMARY KEY AUTOINCREMENT,
+                [Партнер] NVARCHAR(255) NULL,
+                [Изменено] TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """],
+    }),
+    (6, "Версии строк партнеров и заявок для оптимистичной блокировки", {
+        "mssql": [
+            """
+            IF COL_LENGTH(N'[Партнеры]', N'Версия строки') IS NULL
+            ALTER TABLE [Партнеры] ADD [Версия строки] INT NOT NULL
+                CONSTRAINT [DF_Партнеры_Версия_строки] DEFAULT 1
+            """,
+            """
+            IF COL_LENGTH(N'[Запросы партнеров]', N'Версия строки') IS NULL
+            ALTER TABLE [Запросы партнеров] ADD [Версия строки] INT NOT NULL
+                CONSTRAINT [DF_Запросы_партнеров_Версия_строки] DEFAULT 1
+            """,
+        ],
+        "sqlite": [
+            _sqlite_add_column("Партнеры", "Версия строки", "INTEGER NOT NULL DEFAULT 1"),
+            _sqlite_add_column("Запросы партнеров", "Версия строки", "INTEGER NOT NULL DEFAULT 1"),
+        ],
+    }),
+    # Индексы сортировки из миграции 4 заменяются фильтрованными: архивные партнеры в них не попадают
+    (7, "Архив партнеров (мягкое удаление) и фильтрованные индексы активных партнеров", {
+        "mssql": [
+            """
+            IF COL_LENGTH(N'[Партнеры]', N'Архивирован') IS NULL
+            ALTER TABLE [Партнеры] ADD [Архивирован] BIT NOT NULL
+                CONSTRAINT [DF_Партнеры_Архивирован] DEFAULT 0,
+                [Дата архивации] DATETIME2 NULL
+            """,
+            """
+            IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Партнеры_Тип' AND object_id = OBJECT_ID(N'[Партнеры]'))
+            DROP INDEX [IX_Партнеры_Тип] ON [Партнеры]
+            """,
+            """
+            IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_Партнеры_Рейтинг' AND object_id = OBJECT_ID(N'[Партнеры]'))
+            DROP INDEX [IX_Партнеры_Рейтинг] ON [Партнеры]
+            """,
+            _mssql_index("IX_Партнеры_Активные_Тип", "[Партнеры]", """
+                CREATE INDEX [IX_Партнеры_Активные_Тип]
+                ON [Партнеры] ([Тип партнера], [Наименование партнера])
+                WHERE [Архивирован] = 0
+            """),
+            _mssql_index("IX_Партнеры_Активные_Рейтинг", "[Партнеры]", """
+                CREATE INDEX [IX_Партнеры_Активные_Рейтинг]
+                ON [Партнеры] ([Рейтинг], [Наименование партнера])
+                WHERE [Архивирован] = 0
+            """),
+            _mssql_index("IX_Партнеры_Архив", "[Партнеры]", """
+                CREATE INDEX [IX_Партнеры_Архив]
+                ON [Партнеры] ([Дата архивации])
+                WHERE [Архивирован] = 1
+            """),
+        ],
+        "sqlite": [
+            _sqlite_add_column("Партнеры", "Архивирован", "INTEGER NOT NULL DEFAULT 0"),
+            _sqlite_add_column("Партнеры", "Дата архивации", "TEXT NULL"),
+            "DROP INDEX IF EXISTS [IX_Партнеры_Тип]",
+            "DROP INDEX IF EXISTS [IX_Партнеры_Рейтинг]",
+            """CREATE INDEX IF NOT EXISTS [IX_Партнеры_Активные_Тип]
+               ON [Партнеры] ([Тип партнера], [Наименование партнера]) WHERE [Архивирован] = 0""",
+            """CREATE INDEX IF NOT EXISTS [IX_Партнеры_Активные_Рейтинг]
+               ON [Партнеры] ([Рейтинг], [Наименование партнера]) WHERE [Архивирован] = 0""",
+            """CREATE INDEX IF NOT EXISTS [IX_Партнеры_Архив]
+               ON [Партнеры] ([Дата архивации]) WHERE [Архивирован] = 1""",
+        ],
+    }),
+]
+
+def applied_versions(conn, backend):
+    cursor = conn.cursor()
+    for statement in VERSION_TABLE[backend]:
+        cursor.execute(statement)
+    cursor.execute("SELECT [Версия] FROM [Версия схемы]")
+    return {row[0] for row in cursor.fetchall()}
+
+def migrate(conn, backend):
+    """Применяет недостающие миграции, каждую в своей транзакции. Возвращает номера применённых"""
+    applied = applied_versions(conn, backend)
+    conn.commit()
+    newly_applied = []
+    for version, description, scripts in MIGRATIONS:
+        if version in applied:
+            continue
+        cursor = conn.cursor()
+        try:
+            for statement in scripts[backend]:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO [Версия схемы] ([Версия], [Описание]) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        newly_applied.append(version)
+    if newly_applied:
+        # Миграции меняют справочные таблицы (например, [Типы материалов]): каталог читается заново
+        catalog_cache.invalidate()
+    return newly_applied
@@ -0,0 +1,48 @@
+import decimal
+from collections import namedtuple
+
+from pricing import _decimal
+
+# Потребность в материалах для заявок активных партнеров:
+# количество продукции * коэффициент типа продукции * (1 + процент брака материала / 100).
+# Коэффициент и процент брака постоянны для типа продукции, поэтому строки заявок не перебираются:
+# БД суммирует количество одним GROUP BY по типу продукции и материалу (repository.material_groups),
+# а формула применяется здесь к каждой группе. Расчёт в Decimal, потребность округляется вверх
+# до целых единиц материала один раз на группу.
+
+# Группа строк заявок: тип продукции, коэффициент, тип материала (None - не задан), процент брака,
+# число строк, количество продукции
+MaterialGroup = namedtuple("MaterialGroup", [
+    "product_type", "coefficient", "material", "defect_percent", "lines", "quantity"
+])
+MaterialRequirement = namedtuple("MaterialRequirement", [
+    "material", "product_type", "lines", "quantity", "coefficient", "defect_percent", "amount"
+])
+
+def requirement_amount(quantity, coefficient, defect_percent):
+    """Потребность в материале для quantity единиц продукции, целых единиц (с округлением вверх)"""
+    amount = quantity * _decimal(coefficient) * (1 + _decimal(defect_percent) / 100)
+    return int(amount.to_integral_value(rounding=decimal.ROUND_CEILING))
+
+def material_requirements(groups):
+    """Потребность по группам (материал, тип продукции), упорядоченная по материалу и типу продукции"""
+    requirements = [
+        MaterialRequirement(
+            group.material, group.product_type, group.lines, group.quantity,
+            _decimal(group.coefficient), _decimal(group.defect_percent),
+            requirement_amount(group.quantity, group.coefficient, group.defect_percent)
+        )
+        for group in groups
+    ]
+    requirements.sort(key=lambda requirement: (requirement.material is None, requirement.material or "",
+                                               requirement.product_type))
+    return requirements
+
+def material_totals(requirements):
+    """Итого по материалам: {материал: (строк заявок, количество продукции, потребность)}"""
+    totals = {}
+    for requirement in requirements:
+        lines, quantity, amount = totals.get(requirement.material, (0, 0, 0))
+        totals[requirement.material] = (lines + requirement.lines, quantity + requirement.quantity,
+                                        amount + requirement.amount)
+    return totals
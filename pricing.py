@@ -0,0 +1,51 @@
+import decimal
+
+# Точный расчёт стоимости в целых числах.
+# Цена хранится в копейках, процент брака - в сотых долях процента (DECIMAL(5,2) * 100),
+# поэтому стоимость строки qty * price * (1 + defect / 100) без потерь равна
+# qty * price_kopecks * (10000 + defect_units) в единицах 1/10000 копейки.
+# Округление до копеек выполняется один раз для итога, как у SUM(...) в SQL, по правилу
+# "половина вверх", как при приведении к DECIMAL(18,2) в SQL Server.
+KOPECKS = 100
+DEFECT_SCALE = 100
+EXACT_SCALE = 100 * DEFECT_SCALE
+
+def _decimal(value):
+    if value is None:
+        return decimal.Decimal(0)
+    if isinstance(value, float):
+        return decimal.Decimal(str(value))
+    return decimal.Decimal(value)
+
+def _scaled(value, scale):
+    return int((_decimal(value) * scale).quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))
+
+def to_kopecks(value):
+    return _scaled(value, KOPECKS)
+
+def defect_units(percent):
+    return _scaled(percent, DEFECT_SCALE)
+
+def line_exact(quantity, price_kopecks, defect):
+    """Точная стоимость строки в единицах 1/EXACT_SCALE копейки"""
+    return quantity * price_kopecks * (EXACT_SCALE + defect)
+
+def round_exact(exact):
+    """Округление точной суммы до копеек (половина вверх)"""
+    sign = -1 if exact < 0 else 1
+    return sign * ((abs(exact) + EXACT_SCALE // 2) // EXACT_SCALE)
+
+def price_book(lines):
+    """Итоги всех партнеров в копейках за один проход по строкам
+    (партнер, price_kopecks, defect_units, quantity); возвращает {партнер: (строк, количество, копейки)}"""
+    exact = {}
+    for partner_name, price, defect, quantity in lines:
+        count, total_quantity, total = exact.get(partner_name, (0, 0, 0))
+        exact[partner_name] = (count + 1, total_quantity + quantity, total + quantity * price * (EXACT_SCALE + defect))
+    return {name: (count, quantity, round_exact(total)) for name, (count, quantity, total) in exact.items()}
+
+def kopecks_to_decimal(kopecks):
+    return decimal.Decimal(kopecks).scaleb(-2)
+
+def exact_to_decimal(exact):
+    return kopecks_to_decimal(round_exact(exact))
@@ -0,0 +1,746 @@
+import decimal
+
+from catalog import ProductCatalog, catalog_cache
+from db import get_provider
+from instrumentation import record_error
+from migrations import PARTNER_TOTALS_INSERT
+from planning import MaterialGroup
+from pricing import to_kopecks, defect_units, price_book, kopecks_to_decimal
+
+# Поля партнера в порядке столбцов таблицы [Партнеры]
+PARTNER_FIELDS = [
+    "Наименование партнера", "Тип партнера", "Директор", "Электронная почта партнера",
+    "Телефон партнера", "Юридический адрес партнера", "ИНН", "Рейтинг"
+]
+PARTNER_COLUMNS = ", ".join(f"p.[{field}]" for field in PARTNER_FIELDS)
+
+# Выражения стоимости строки заявки: с учетом брака материала и базовое (fallback)
+COST_EXPR_DEFECT = (
+    "rp.[Количество] * pr.[Минимальная стоимость для партнера] * "
+    "(1 + COALESCE(m.[Процент брака материала], 0) / 100.0)"
+)
+COST_EXPR_BASE = "rp.[Количество] * pr.[Минимальная стоимость для партнера]"
+DEFECT_JOIN = "LEFT JOIN [Типы материалов] m ON pr.[Тип продукции] = m.[Тип материала]"
+
+# Строки заявок для расчёта в pricing.py: (партнер, цена, процент брака, количество)
+PRICING_LINES_SELECT = """
+    SELECT rp.[Партнер], pr.[Минимальная стоимость для партнера], m.[Процент брака материала], rp.[Количество]
+    FROM [Запросы партнеров] rp
+    JOIN [Продукция] pr ON rp.[Продукция] = pr.[Наименование продукции]
+    LEFT JOIN [Типы материалов] m ON pr.[Тип продукции] = m.[Тип материала]
+    {filter}
+"""
+# Строки заявок только активных (не архивных) партнеров - для полного пересчёта итогов
+ACTIVE_LINES_FILTER = (
+    "WHERE rp.[Партнер] IN (SELECT [Наименование партнера] FROM [Партнеры] WHERE [Архивирован] = 0)"
+)
+FETCH_SIZE = 5000
+# Изменений за один опрос, больше - клиент перечитывает список целиком
+CHANGES_LIMIT = 500
+# Сколько дней хранить журнал изменений
+CHANGES_RETENTION_DAYS = 7
+# Значений в одном IN (...): SQL Server допускает не более 2100 параметров в запросе
+IN_BATCH = 500
+
+# Сортировки списка партнеров: столбец и значение ключа строки (данные партнера, стоимость).
+# Наименование партнера (первичный ключ) добавляется вторым ключом, чтобы порядок был однозначным
+PAGE_SIZE = 100
+PARTNER_SORTS = {
+    "name": ("p.[Наименование партнера]", lambda row: row[0]["Наименование партнера"]),
+    "type": ("p.[Тип партнера]", lambda row: row[0]["Тип партнера"]),
+    "rating": ("p.[Рейтинг]", lambda row: row[0]["Рейтинг"]),
+    "cost": ("t.[Стоимость]", lambda row: row[1]),
+}
+# Поля, по которым ищет строка поиска
+PARTNER_SEARCH_FIELDS = ["Наименование партнера", "Директор", "ИНН", "Телефон партнера"]
+
+def page_key(row, sort="name"):
+    """Ключ строки для постраничной загрузки: (значение сортировки, наименование партнера)"""
+    return PARTNER_SORTS[sort][1](row), row[0]["Наименование партнера"]
+
+def like_pattern(text):
+    """Шаблон LIKE для подстроки с экранированием служебных символов (ESCAPE '\\')"""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+    return f"%{escaped}%"
+
+def to_money(value):
+    """Денежное значение из БД, округлённое до копеек так же, как в pricing.py"""
+    return max(kopecks_to_decimal(to_kopecks(value)), decimal.Decimal('0.00'))
+
+# Разница между загруженными строками заявки (ID, продукция, количество, версия строки)
+# и текущими (продукция, количество): строки на вставку, изменение и удаление
+def diff_request_items(original, current):
+    original_ids = {}
+    for line_id, product_name, quantity, _ in original:
+        original_ids.setdefault(product_name, []).append((line_id, quantity))
+    inserts, updates = [], []
+    for product_name, quantity in current:
+        lines = original_ids.get(product_name)
+        if lines:
+            line_id, old_quantity = lines.pop(0)
+            if quantity != old_quantity:
+                updates.append((quantity, line_id))
+        else:
+            inserts.append((product_name, quantity))
+    deletes = [(line_id,) for lines in original_ids.values() for line_id, _ in lines]
+    return inserts, updates, deletes
+
+# Трёхстороннее слияние заявки: base - строки, с которых начато редактирование, mine - строки диалога
+# (продукция, количество), theirs - текущие строки в БД. Изменения другого пользователя принимаются
+# там, где текущий пользователь строку не менял; где менялись обе стороны - остаётся своё значение.
+# Возвращает (строки (продукция, количество), продукция с конфликтующими изменениями)
+def merge_request_items(base, mine, theirs):
+    base_lines = {product_name: (quantity, version) for _, product_name, quantity, version in base}
+    their_lines = {product_name: (quantity, version) for _, product_name, quantity, version in theirs}
+    my_quantities = dict(mine)
+    merged, conflicts = [], []
+    order = [product_name for _, product_name, _, _ in theirs]
+    order += [product_name for product_name, _ in mine if product_name not in their_lines]
+    for product_name in dict.fromkeys(order + list(base_lines)):
+        base_line = base_lines.get(product_name)
+        their_line = their_lines.get(product_name)
+        base_quantity = base_line[0] if base_line else None
+        their_quantity = their_line[0] if their_line else None
+        my_quantity = my_quantities.get(product_name)
+        theirs_changed = base_line != their_line
+        mine_changed = my_quantity != base_quantity
+        if not theirs_changed:
+            quantity = my_quantity
+        elif not mine_changed:
+            quantity = their_quantity
+        else:
+            quantity = my_quantity
+            if my_quantity != their_quantity:
+                conflicts.append(product_name)
+        if quantity is not None:
+            merged.append((product_name, quantity))
+    return merged, conflicts
+
+class PartnerExistsError(Exception):
+    pass
+
+class SaveConflictError(Exception):
+    """Заявку изменил или удалил другой пользователь после её загрузки в диалог.
+    partner_version и lines - текущее состояние в БД (None, если партнер удалён)"""
+    def __init__(self, message, partner_version=None, lines=None):
+        super().__init__(message)
+        self.partner_version = partner_version
+        self.lines = lines
+
+# Операции с данными, которые использует интерфейс. Все методы принимают соединение DB-API;
+# SQL общий для MS SQL Server и SQLite (оба понимают идентификаторы в [скобках] и параметры ?),
+# различия диалектов вынесены в переопределяемые методы наследников
+class PartnerRepository:
+    def _cost_query(self, partner_filter, with_defect):
+        cost_expr = COST_EXPR_DEFECT if with_defect else COST_EXPR_BASE
+        defect_join = DEFECT_JOIN if with_defect else ""
+        return f"""
+            SELECT rp.[Партнер], SUM({cost_expr})
+            FROM [Запросы партнеров] rp
+            JOIN [Продукция] pr ON rp.[Продукция] = pr.[Наименование продукции]
+            {defect_join}
+            {partner_filter}
+            GROUP BY rp.[Партнер]
+        """
+
+    def _execute_cost_query(self, cursor, partner_filter="", params=()):
+        try:
+            cursor.execute(self._cost_query(partner_filter, with_defect=True), params)
+            return cursor.fetchall()
+        except Exception as e:
+            # Fallback на случай отсутствия таблицы [Типы материалов]
+            record_error("Ошибка расчета стоимости с учетом брака", e)
+            cursor.execute(self._cost_query(partner_filter, with_defect=False), params)
+            return cursor.fetchall()
+
+    def _executemany(self, cursor, query, params):
+        if params:
+            cursor.executemany(query, params)
+
+    def request_cost(self, conn, partner_name):
+        """Стоимость заявки партнера с учетом брака материала"""
+        try:
+            rows = self._execute_cost_query(conn.cursor(), "WHERE rp.[Партнер] = ?", (partner_name,))
+            return to_money(rows[0][1] if rows else None)
+        except Exception as e2:
+            record_error("Ошибка fallback расчета", e2)
+            return decimal.Decimal('0.00')
+
+    def _partner_rows_from_totals(self, cursor, partner_filter="", params=()):
+        cursor.execute(f"""
+            SELECT {PARTNER_COLUMNS}, t.[Стоимость]
+            FROM [Партнеры] p
+            JOIN [Итоги партнеров] t ON t.[Партнер] = p.[Наименование партнера] AND p.[Архивирован] = 0
+            {partner_filter}
+        """, params)
+        return [(dict(zip(PARTNER_FIELDS, row[:-1])), to_money(row[-1])) for row in cursor.fetchall()]
+
+    def list_partners_with_totals(self, conn):
+        """Все партнеры с заявками вместе со стоимостью из таблицы [Итоги партнеров]"""
+        cursor = conn.cursor()
+        try:
+            return self._partner_rows_from_totals(cursor)
+        except Exception as e:
+            record_error("Ошибка чтения итогов партнеров", e)
+        # Итогов ещё нет (схема не обновлена): считаем по строкам заявок
+        cursor.execute(f"""
+            SELECT {PARTNER_COLUMNS}
+            FROM [Партнеры] p
+            WHERE EXISTS (
+                SELECT 1 FROM [Запросы партнеров] rp WHERE rp.[Партнер] = p.[Наименование партнера]
+            )
+        """)
+        partners = [dict(zip(PARTNER_FIELDS, row)) for row in cursor.fetchall()]
+        try:
+            costs = {name: to_money(total) for name, total in self._execute_cost_query(cursor)}
+        except Exception as e2:
+            record_error("Ошибка fallback расчета", e2)
+            costs = {}
+        return [(p, costs.get(p["Наименование партнера"], decimal.Decimal('0.00'))) for p in partners]
+
+    def _limit(self, query):
+        return query + " OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY"
+
+    def _search_condition(self, search):
+        """Условие поиска и его параметры"""
+        pattern = like_pattern(search)
+        condition = " OR ".join(f"p.[{field}] LIKE ? ESCAPE '\\'" for field in PARTNER_SEARCH_FIELDS)
+        return f"({condition})", [pattern] * len(PARTNER_SEARCH_FIELDS)
+
+    def _key_param(self, value):
+        return value
+
+    def list_partners_page(self, conn, search="", sort="name", descending=False, after=None, limit=PAGE_SIZE):
+        """Страница партнеров с заявками: отбор строкой поиска, сортировка и пагинация по ключу.
+        after - page_key() последней строки предыдущей страницы"""
+        column = PARTNER_SORTS[sort][0]
+        direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+        conditions, params = [], []
+        if search:
+            condition, search_params = self._search_condition(search)
+            conditions.append(condition)
+            params += search_params
+        if after is not None:
+            value, name = after
+            value = self._key_param(value)
+            conditions.append(f"({column} {compare} ? OR ({column} = ? AND p.[Наименование партнера] {compare} ?))")
+            params += [value, value, name]
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        cursor = conn.cursor()
+        try:
+            return self._partner_rows_from_totals(cursor, self._limit(f"""
+                {where}
+                ORDER BY {column} {direction}, p.[Наименование партнера] {direction}
+            """), params + [limit])
+        except Exception as e:
+            record_error("Ошибка постраничной загрузки партнеров", e)
+        # Итогов ещё нет (схема не обновлена): отбор и сортировка по полному списку
+        rows = self.list_partners_with_totals(conn)
+        if search:
+            needle = search.casefold()
+            rows = [row for row in rows
+                    if any(needle in str(row[0][field]).casefold() for field in PARTNER_SEARCH_FIELDS)]
+        rows.sort(key=lambda row: page_key(row, sort), reverse=descending)
+        if after is not None:
+            rows = [row for row in rows
+                    if (page_key(row, sort) < after if descending else page_key(row, sort) > after)]
+        return rows[:limit]
+
+    def refresh_partner_totals(self, cursor, partner_name):
+        """Пересчитывает строку [Итоги партнеров] одного партнера в текущей транзакции
+        и отмечает изменение партнера в журнале для других клиентов"""
+        self._refresh_totals(cursor, [partner_name])
+        self.log_change(cursor, partner_name)
+
+    def _refresh_totals(self, cursor, partner_names):
+        """Итоги порции партнеров (не больше IN_BATCH): одно удаление и один сгруппированный пересчёт"""
+        placeholders = ", ".join("?" * len(partner_names))
+        cursor.execute(f"DELETE FROM [Итоги партнеров] WHERE [Партнер] IN ({placeholders})", partner_names)
+        cursor.execute(PARTNER_TOTALS_INSERT.format(filter=f"WHERE rp.[Партнер] IN ({placeholders})"), partner_names)
+
+    def price_partner_book(self, conn, partner_name=None):
+        """Точные итоги {партнер: (строк, количество, копейки)} по строкам заявок, за один проход"""
+        if partner_name is None:
+            return self._price_book(conn.cursor(), ACTIVE_LINES_FILTER)
+        return self._price_book(conn.cursor(), "WHERE rp.[Партнер] = ?", (partner_name,))
+
+    def _price_book(self, cursor, partner_filter, params=()):
+        cursor.execute(PRICING_LINES_SELECT.format(filter=partner_filter), params)
+
+        def lines():
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    return
+                for partner, price, defect, quantity in rows:
+                    yield partner, to_kopecks(price), defect_units(defect), quantity
+
+        return price_book(lines())
+
+    def export_lines(self, conn, partner_name=None, search=""):
+        """Строки заявок для выгрузки, по партнерам: (партнер, продукция, количество, цена, процент брака).
+        Читаются порциями по FETCH_SIZE по мере потребления, а не целиком"""
+        conditions, params = ["p.[Архивирован] = 0"], []
+        if partner_name is not None:
+            conditions.append("p.[Наименование партнера] = ?")
+            params.append(partner_name)
+        if search:
+            condition, search_params = self._search_condition(search)
+            conditions.append(condition)
+            params += search_params
+        where = "WHERE " + " AND ".join(conditions)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT rp.[Партнер], rp.[Продукция], rp.[Количество],
+                   pr.[Минимальная стоимость для партнера], m.[Процент брака материала]
+            FROM [Запросы партнеров] rp
+            JOIN [Партнеры] p ON rp.[Партнер] = p.[Наименование партнера]
+            JOIN [Продукция] pr ON rp.[Продукция] = pr.[Наименование продукции]
+            {DEFECT_JOIN}
+            {where}
+            ORDER BY rp.[Партнер], rp.[ID]
+        """, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield tuple(row)
+
+    def material_groups(self, conn):
+        """Строки заявок активных партнеров, сгруппированные по типу продукции и материалу (planning.py)"""
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT pr.[Тип продукции], tp.[Коэффициент типа продукции],
+                   m.[Тип материала], m.[Процент брака материала], COUNT(*), SUM(rp.[Количество])
+            FROM [Запросы партнеров] rp
+            JOIN [Продукция] pr ON rp.[Продукция] = pr.[Наименование продукции]
+            JOIN [Типы продукции] tp ON pr.[Тип продукции] = tp.[Тип продукции]
+            {DEFECT_JOIN}
+            {ACTIVE_LINES_FILTER}
+            GROUP BY pr.[Тип продукции], tp.[Коэффициент типа продукции],
+                     m.[Тип материала], m.[Процент брака материала]
+        """)
+        return [MaterialGroup(*row) for row in cursor.fetchall()]
+
+    def rebuild_partner_totals(self, conn):
+        """Полный пересчёт [Итоги партнеров], например после изменения процентов брака.
+        Клиенты после этого перечитывают список целиком"""
+        count = self._rebuild_totals(conn)
+        self.log_change(conn.cursor(), None)
+        return count
+
+    def _rebuild_totals(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM [Итоги партнеров]")
+        cursor.execute(PARTNER_TOTALS_INSERT.format(filter=ACTIVE_LINES_FILTER))
+        cursor.execute("SELECT COUNT(*) FROM [Итоги партнеров]")
+        return cursor.fetchone()[0]
+
+    def load_partner(self, conn, partner_name):
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT [Тип партнера], [Директор], [Юридический адрес партнера], "
+            "[Телефон партнера], [Электронная почта партнера], [Рейтинг], [ИНН], [Версия строки] "
+            "FROM [Партнеры] WHERE [Наименование партнера] = ? AND [Архивирован] = 0",
+            (partner_name,)
+        )
+        return cursor.fetchone()
+
+    def load_request_lines(self, conn, partner_name):
+        """Строки заявки партнера: (ID, продукция, количество, версия строки)"""
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT [ID], [Продукция], [Количество], [Версия строки] FROM [Запросы партнеров] "
+            "WHERE [Партнер] = ? ORDER BY [ID]",
+            (partner_name,)
+        )
+        return [tuple(row) for row in cursor.fetchall()]
+
+    def fetch_catalog(self, conn):
+        cursor = conn.cursor()
+        materials_defect = {}
+        try:
+            # Загрузка процентов брака материалов
+            cursor.execute("SELECT [Тип материала], [Процент брака материала] FROM [Типы материалов]")
+            for row in cursor.fetchall():
+                materials_defect[row[0]] = row[1]
+        except Exception as e:
+            record_error("Ошибка загрузки процентов брака", e)
+        # Загрузка продукции с типами
+        cursor.execute("""
+            SELECT p.[Артикул], p.[Наименование продукции], p.[Минимальная стоимость для партнера], tp.[Тип продукции]
+            FROM [Продукция] p
+            JOIN [Типы продукции] tp ON p.[Тип продукции] = tp.[Тип продукции]
+        """)
+        return ProductCatalog(cursor.fetchall(), materials_defect)
+
+    def catalog_signature(self, conn):
+        """Сигнатура справочных таблиц для проверки изменений без чтения самих данных.
+        None - сигнатуры нет: каталог перечитывается по истечении TTL"""
+        return None
+
+    def load_catalog(self, conn):
+        """Каталог продукции из общего кэша (см. catalog.CatalogCache)"""
+        def load():
+            catalog = self.fetch_catalog(conn)
+            # Индекс поиска строится здесь, в потоке загрузки: каталог из кэша может попасть
+            # в диалог через peek(), и поток интерфейса не должен строить индекс при первом вводе
+            catalog.search_index
+            return catalog
+        return catalog_cache.get(load, lambda: self.catalog_signature(conn))
+
+    def partner_version(self, conn, partner_name):
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT [Версия строки] FROM [Партнеры] WHERE [Наименование партнера] = ? AND [Архивирован] = 0",
+            (partner_name,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def touch_partners(self, conn, partner_names):
+        """Заявки партнеров изменены не через диалог (например, импортом): новая версия партнеров,
+        пересчёт их итогов и записи в журнале изменений. По одному UPDATE, DELETE и INSERT ... SELECT
+        на порцию из IN_BATCH наименований"""
+        cursor = conn.cursor()
+        names = sorted(partner_names)
+        for i in range(0, len(names), IN_BATCH):
+            batch = names[i:i + IN_BATCH]
+            # Новая версия строки: открытые в диалогах заявки не перезапишут изменённые строки
+            cursor.execute(f"""
+                UPDATE [Партнеры] SET [Версия строки] = [Версия строки] + 1
+                WHERE [Наименование партнера] IN ({", ".join("?" * len(batch))})
+            """, batch)
+            self._refresh_totals(cursor, batch)
+        self._executemany(cursor, "INSERT INTO [Журнал изменений] ([Партнер]) VALUES (?)",
+                          [(name,) for name in names])
+
+    def save_request(self, conn, is_new, partner, items, original_items=(), partner_version=None):
+        """Сохраняет партнера и изменившиеся строки заявки; коммит выполняет вызывающий код.
+        При редактировании партнер обновляется только при версии partner_version, с которой начато
+        редактирование; иначе SaveConflictError с текущим состоянием заявки"""
+        cursor = conn.cursor()
+        partner_name = partner["Наименование партнера"]
+        if is_new:
+            cursor.execute(
+                "SELECT [Архивирован] FROM [Партнеры] WHERE [Наименование партнера] = ?",
+                (partner_name,)
+            )
+            row = cursor.fetchone()
+            if row is not None and row[0]:
+                raise PartnerExistsError("Партнер с таким наименованием находится в архиве.")
+            if row is not None:
+                raise PartnerExistsError("Партнер с таким наименованием уже существует.")
+
+            cursor.execute("""
+                INSERT INTO [Партнеры] (
+                    [Наименование партнера], [Тип партнера], [Директор],
+                    [Электронная почта партнера], [Телефон партнера],
+                    [Юридический адрес партнера], [ИНН], [Рейтинг]
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, tuple(partner[field] for field in PARTNER_FIELDS))
+        else:
+            # При редактировании обновляем только рейтинг. Проверка версии первой же командой:
+            # при конфликте транзакция ничего не успевает изменить и блокирует одну строку партнера
+            if partner_version is None:
+                cursor.execute("""
+                    UPDATE [Партнеры] SET [Рейтинг] = ?, [Версия строки] = [Версия строки] + 1
+                    WHERE [Наименование партнера] = ?
+                """, (partner["Рейтинг"], partner_name))
+            else:
+                cursor.execute("""
+                    UPDATE [Партнеры] SET [Рейтинг] = ?, [Версия строки] = [Версия строки] + 1
+                    WHERE [Наименование партнера] = ? AND [Версия строки] = ?
+                """, (partner["Рейтинг"], partner_name, partner_version))
+                if cursor.rowcount == 0:
+                    current_version = self.partner_version(conn, partner_name)
+                    if current_version is None:
+                        raise SaveConflictError("Партнер удалён другим пользователем.")
+                    raise SaveConflictError(
+                        "Заявка изменена другим пользователем после её открытия.",
+                        current_version, self.load_request_lines(conn, partner_name)
+                    )
+
+        # Записываем только изменившиеся строки продукции, пакетами в одной транзакции
+        inserts, updates, deletes = diff_request_items(original_items, items)
+        self._executemany(cursor, "DELETE FROM [Запросы партнеров] WHERE [ID] = ?", deletes)
+        self._executemany(
+            cursor,
+            "UPDATE [Запросы партнеров] SET [Количество] = ?, [Версия строки] = [Версия строки] + 1 WHERE [ID] = ?",
+            updates
+        )
+        self._executemany(cursor, """
+            INSERT INTO [Запросы партнеров] (
+                [Продукция], [Партнер], [Количество]
+            ) VALUES (?, ?, ?)
+        """, [(product_name, partner_name, quantity) for product_name, quantity in inserts])
+        self.refresh_partner_totals(cursor, partner_name)
+        return partner_name
+
+    def _select_in(self, cursor, query, values):
+        """query с {placeholders} для IN (...), выполняется порциями по IN_BATCH значений"""
+        values = list(values)
+        for i in range(0, len(values), IN_BATCH):
+            batch = values[i:i + IN_BATCH]
+            cursor.execute(query.format(placeholders=", ".join("?" * len(batch))), batch)
+            yield from cursor.fetchall()
+
+    def existing_partners(self, conn, partner_names):
+        """Какие из наименований есть среди активных партнеров"""
+        return {row[0] for row in self._select_in(
+            conn.cursor(),
+            "SELECT [Наименование партнера] FROM [Партнеры] "
+            "WHERE [Наименование партнера] IN ({placeholders}) AND [Архивирован] = 0",
+            partner_names
+        )}
+
+    def request_line_keys(self, conn, partner_names):
+        """Пары (партнер, продукция) существующих строк заявок партнеров"""
+        return [tuple(row) for row in self._select_in(
+            conn.cursor(),
+            "SELECT [Партнер], [Продукция] FROM [Запросы партнеров] WHERE [Партнер] IN ({placeholders})",
+            partner_names
+        )]
+
+    def append_request_lines(self, conn, inserts, updates):
+        """Пакетная запись импорта: inserts - (продукция, партнер, количество),
+        updates - (добавляемое количество, партнер, продукция) для уже существующих строк.
+        Итоги партнеров пересчитывает вызывающий код"""
+        cursor = conn.cursor()
+        self._executemany(cursor, """
+            UPDATE [Запросы партнеров] SET [Количество] = [Количество] + ?, [Версия строки] = [Версия строки] + 1
+            WHERE [Партнер] = ? AND [Продукция] = ?
+        """, updates)
+        self._executemany(cursor, """
+            INSERT INTO [Запросы партнеров] (
+                [Продукция], [Партнер], [Количество]
+            ) VALUES (?, ?, ?)
+        """, inserts)
+
+    # Удаление из интерфейса - перевод в архив: партнер пропадает из списка, итогов и выгрузок,
+    # а строки заявок физически удаляет purge_archived (пакетное задание вне рабочего времени)
+    def archive_partners(self, conn, partner_names):
+        """Переводит партнеров в архив; по одному UPDATE/DELETE на порцию из IN_BATCH наименований.
+        Возвращает наименования, которые были активны"""
+        cursor = conn.cursor()
+        archived = []
+        names = list(partner_names)
+        for i in range(0, len(names), IN_BATCH):
+            batch = names[i:i + IN_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            cursor.execute(
+                f"SELECT [Наименование партнера] FROM [Партнеры] "
+                f"WHERE [Наименование партнера] IN ({placeholders}) AND [Архивирован] = 0",
+                batch
+            )
+            archived += [row[0] for row in cursor.fetchall()]
+            # Новая версия строки: открытые в диалогах заявки этих партнеров не сохранятся
+            cursor.execute(f"""
+                UPDATE [Партнеры]
+                SET [Архивирован] = 1, [Дата архивации] = CURRENT_TIMESTAMP, [Версия строки] = [Версия строки] + 1
+                WHERE [Наименование партнера] IN ({placeholders}) AND [Архивирован] = 0
+            """, batch)
+            cursor.execute(f"DELETE FROM [Итоги партнеров] WHERE [Партнер] IN ({placeholders})", batch)
+        self._executemany(cursor, "INSERT INTO [Журнал изменений] ([Партнер]) VALUES (?)",
+                          [(name,) for name in archived])
+        return archived
+
+    def restore_partners(self, conn, partner_names):
+        """Возвращает партнеров из архива. Возвращает наименования, которые были в архиве"""
+        restored = {row[0] for row in self._select_in(
+            conn.cursor(),
+            "SELECT [Наименование партнера] FROM [Партнеры] "
+            "WHERE [Наименование партнера] IN ({placeholders}) AND [Архивирован] = 1",
+            partner_names
+        )}
+        cursor = conn.cursor()
+        names = sorted(restored)
+        for i in range(0, len(names), IN_BATCH):
+            batch = names[i:i + IN_BATCH]
+            cursor.execute(f"""
+                UPDATE [Партнеры]
+                SET [Архивирован] = 0, [Дата архивации] = NULL, [Версия строки] = [Версия строки] + 1
+                WHERE [Наименование партнера] IN ({", ".join("?" * len(batch))})
+            """, batch)
+        for name in names:
+            self.refresh_partner_totals(cursor, name)
+        return names
+
+    def purge_archived(self, conn, days=0):
+        """Физически удаляет партнеров, находящихся в архиве дольше days дней, вместе с их заявками.
+        Возвращает число удалённых партнеров"""
+        archived = (
+            "SELECT [Наименование партнера] FROM [Партнеры] "
+            f"WHERE [Архивирован] = 1 AND [Дата архивации] <= {self._days_ago_expr()}"
+        )
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM [Итоги партнеров] WHERE [Партнер] IN ({archived})", (days,))
+        cursor.execute(f"DELETE FROM [Запросы партнеров] WHERE [Партнер] IN ({archived})", (days,))
+        cursor.execute(
+            f"DELETE FROM [Партнеры] WHERE [Архивирован] = 1 AND [Дата архивации] <= {self._days_ago_expr()}",
+            (days,)
+        )
+        return cursor.rowcount
+
+    # Журнал изменений: клиенты опрашивают записи с версией больше своей и перечитывают только
+    # изменившихся партнеров. Партнер NULL - изменилось всё (например, пересчёт итогов)
+    def log_change(self, cursor, partner_name):
+        cursor.execute("INSERT INTO [Журнал изменений] ([Партнер]) VALUES (?)", (partner_name,))
+
+    def change_version(self, conn):
+        """Текущая версия журнала - метка синхронизации для changes_since"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX([Версия]), 0) FROM [Журнал изменений]")
+        return cursor.fetchone()[0]
+
+    def changes_since(self, conn, version, limit=CHANGES_LIMIT):
+        """(новая версия, изменившиеся партнеры) после version. Вместо партнеров None, если нужно
+        перечитать всё: полный пересчёт, слишком много изменений или журнал уже очищен после version"""
+        cursor = conn.cursor()
+        cursor.execute(self._limit("""
+            SELECT [Версия], [Партнер] FROM [Журнал изменений]
+            WHERE [Версия] > ?
+            ORDER BY [Версия]
+        """), (version, limit + 1))
+        rows = cursor.fetchall()
+        if not rows:
+            return version, set()
+        new_version = rows[-1][0]
+        if len(rows) > limit or any(partner_name is None for _, partner_name in rows):
+            return self.change_version(conn), None
+        if rows[0][0] > version + 1:
+            # Пропуск в версиях: записи могли быть удалены очисткой журнала (или откатом транзакции)
+            cursor.execute("SELECT MIN([Версия]) FROM [Журнал изменений]")
+            if version and cursor.fetchone()[0] > version:
+                return self.change_version(conn), None
+        return new_version, {partner_name for _, partner_name in rows}
+
+    def prune_changes(self, conn, days=CHANGES_RETENTION_DAYS):
+        cursor = conn.cursor()
+        cursor.execute(f"DELETE FROM [Журнал изменений] WHERE [Изменено] < {self._days_ago_expr()}", (days,))
+        return cursor.rowcount
+
+    def _days_ago_expr(self):
+        return "DATEADD(day, -?, SYSDATETIME())"
+
+    def load_partner_rows(self, conn, partner_names, search=""):
+        """Текущие строки партнеров списка: {наименование: (данные, стоимость) или None}.
+        None - партнера нет, у него нет заявок или он не подходит под строку поиска"""
+        rows = dict.fromkeys(partner_names)
+        names = list(partner_names)
+        cursor = conn.cursor()
+        for i in range(0, len(names), IN_BATCH):
+            batch = names[i:i + IN_BATCH]
+            condition = f"WHERE p.[Наименование партнера] IN ({', '.join('?' * len(batch))})"
+            params = list(batch)
+            if search:
+                search_condition, search_params = self._search_condition(search)
+                condition += " AND " + search_condition
+                params += search_params
+            for row in self._partner_rows_from_totals(cursor, condition, params):
+                rows[row[0]["Наименование партнера"]] = row
+        return rows
+
+class MssqlRepository(PartnerRepository):
+    def _executemany(self, cursor, query, params):
+        if params:
+            cursor.fast_executemany = True
+            cursor.executemany(query, params)
+
+    def catalog_signature(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM [Продукция]),
+                (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM [Продукция]),
+                (SELECT CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM [Типы продукции])
+        """)
+        signature = tuple(cursor.fetchone())
+        try:
+            cursor.execute("SELECT COUNT(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM [Типы материалов]")
+            signature += tuple(cursor.fetchone())
+        except Exception:
+            pass
+        return signature
+
+class SqliteRepository(PartnerRepository):
+    def _limit(self, query):
+        return query + " LIMIT ?"
+
+    def _search_condition(self, search):
+        # LIKE в SQLite не различает регистр только для латиницы: сравниваем через casefold (см. db.py)
+        pattern = like_pattern(search.casefold())
+        condition = " OR ".join(f"casefold(p.[{field}]) LIKE ? ESCAPE '\\'" for field in PARTNER_SEARCH_FIELDS)
+        return f"({condition})", [pattern] * len(PARTNER_SEARCH_FIELDS)
+
+    def _days_ago_expr(self):
+        return "datetime('now', '-' || ? || ' days')"
+
+    def _key_param(self, value):
+        # Стоимость хранится как REAL; Decimal в параметре SQLite сравнивал бы как текст
+        return float(value) if isinstance(value, decimal.Decimal) else value
+
+    # В SQLite DECIMAL хранится как REAL, поэтому итоги считаются точно в pricing.py, а не в SQL
+    def _write_totals(self, cursor, totals):
+        self._executemany(cursor, """
+            INSERT INTO [Итоги партнеров] ([Партнер], [Число строк], [Количество], [Стоимость])
+            VALUES (?, ?, ?, ?)
+        """, [
+            (name, count, quantity, str(kopecks_to_decimal(kopecks)))
+            for name, (count, quantity, kopecks) in totals.items()
+        ])
+
+    def _refresh_totals(self, cursor, partner_names):
+        placeholders = ", ".join("?" * len(partner_names))
+        cursor.execute(f"DELETE FROM [Итоги партнеров] WHERE [Партнер] IN ({placeholders})", partner_names)
+        self._write_totals(cursor, self._price_book(
+            cursor.connection.cursor(), f"WHERE rp.[Партнер] IN ({placeholders})", partner_names
+        ))
+
+    def _rebuild_totals(self, conn):
+        totals = self.price_partner_book(conn)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM [Итоги партнеров]")
+        self._write_totals(cursor, totals)
+        return len(totals)
+
+    def backfill_totals(self, cursor):
+        """Начальное заполнение [Итоги партнеров] миграцией 3 по тем же точным правилам.
+        Без отбора по архиву: столбец [Архивирован] появляется только в миграции 7"""
+        cursor.execute("DELETE FROM [Итоги партнеров]")
+        self._write_totals(cursor, self._price_book(cursor.connection.cursor(), ""))
+
+    def catalog_signature(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM [Продукция]),
+                (SELECT TOTAL(checksum([Артикул], [Тип продукции], [Наименование продукции],
+                                       [Минимальная стоимость для партнера])) FROM [Продукция]),
+                (SELECT COUNT(*) FROM [Типы продукции]),
+                (SELECT TOTAL(checksum([Тип продукции], [Коэффициент типа продукции])) FROM [Типы продукции])
+        """)
+        signature = tuple(cursor.fetchone())
+        try:
+            cursor.execute(
+                "SELECT COUNT(*), TOTAL(checksum([Тип материала], [Процент брака материала])) FROM [Типы материалов]"
+            )
+            signature += tuple(cursor.fetchone())
+        except Exception:
+            pass
+        return signature
+
+REPOSITORIES = {
+    "mssql": MssqlRepository,
+    "sqlite": SqliteRepository,
+}
+
+_repositories = {}
+
+def get_repository(provider=None):
+    """Репозиторий для бэкенда текущего провайдера соединений"""
+    backend = (provider or get_provider()).backend
+    if backend not in _repositories:
+        _repositories[backend] = REPOSITORIES[backend]()
+    return _repositories[backend]